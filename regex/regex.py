@@ -231,53 +231,436 @@ To parse these we first form a tree just based on the parentheses.
 To be continued...
 
 """
-class NFANode:
-    """Class for NFA nodes.
+import argparse
+import concurrent.futures
+import hashlib
+import mmap
+import os
+import string
+import struct
+import sys
+import tempfile
+import threading
+import weakref
+from array import array
+from bisect import bisect_right
+from collections import namedtuple, OrderedDict
+
+#characters matched by the metacharacter '.'
+ALPHABET = string.printable
+
+#serialized DFA format, see DFA.to_bytes
+DFA_MAGIC = b'RXDF'
+DFA_FORMAT_VERSION = 2
+DFA_HEADER = struct.Struct('<4sHHiiii')
+
+#changed whenever the compiled automata of a pattern change, see DiskCache
+ENGINE_VERSION = 1
+
+CacheInfo = namedtuple('CacheInfo',
+                       ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+def bitset_to_list(mask):
+    """Returns the indexes of the set bits of mask in increasing order
 
-    Id of a node is always its index in NFA.nodes
+    Parameters
+    ----------
+    mask : non-negative integer
+
+    Returns
+    -------
+    result : list (int)
+    """
+    result = []
+    while mask:
+        low_bit = mask & -mask
+        result.append(low_bit.bit_length() - 1)
+        mask ^= low_bit
+
+    return result
+
+def list_to_bitset(node_list):
+    """Returns the bitset with the bits of node_list set
+
+    Parameters
+    ----------
+    node_list : iterable (int)
+        non-negative integers, possibly with duplicates
+
+    Returns
+    -------
+    mask : non-negative integer
+    """
+    node_list = list(node_list)
+    if len(node_list) == 0:
+        return 0
+
+    data = bytearray((max(node_list) >> 3) + 1)
+    for x in node_list:
+        data[x >> 3] |= 1 << (x & 7)
+
+    return int.from_bytes(data, 'little')
+
+class RangeSet:
+    """Set of characters stored as sorted ranges of code points
+
+    Attributes
+    ----------
+    self.starts, self.ends : list (int)
+        the set contains the characters with code points in
+        [self.starts[i], self.ends[i]] for every i
+
+    Notes
+    -----
+    The ranges are sorted, non-overlapping and non-adjacent, so a set has
+    only one representation. Membership is tested with binary search in
+    O(log(number of ranges)) time independent of the number of characters.
+    Used as the label of NFA transitions matching many characters.
+    """
+    def __init__(self, ranges=()):
+        """
+        Parameters
+        ----------
+        ranges : iterable ((str, str))
+            inclusive ranges of characters, may overlap
+        """
+        self.starts = []
+        self.ends = []
+        for first, last in sorted((ord(a), ord(b)) for a, b in ranges):
+            if first > last:
+                raise ValueError("empty range " + repr((chr(first),
+                                                        chr(last))))
+            if self.ends and first <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], last)
+            else:
+                self.starts.append(first)
+                self.ends.append(last)
+
+    @classmethod
+    def from_characters(cls, characters):
+        """Construct the set of characters
+
+        Parameters
+        ----------
+        characters : iterable (str)
+        """
+        return cls((x, x) for x in characters)
+
+    def ranges(self):
+        """Returns the ranges as a list of pairs of characters
+        """
+        return [(chr(a), chr(b)) for a, b in zip(self.starts, self.ends)]
+
+    def __contains__(self, symbol):
+        if len(symbol) != 1:
+            return False
+        code = ord(symbol)
+        i = bisect_right(self.starts, code) - 1
+        return i >= 0 and code <= self.ends[i]
+
+    def __iter__(self):
+        for first, last in zip(self.starts, self.ends):
+            for code in range(first, last + 1):
+                yield chr(code)
+
+    def __len__(self):
+        return sum(b - a + 1 for a, b in zip(self.starts, self.ends))
+
+    def __eq__(self, other):
+        if not isinstance(other, RangeSet):
+            return NotImplemented
+
+        return self.starts == other.starts and self.ends == other.ends
+
+    def __hash__(self):
+        return hash((tuple(self.starts), tuple(self.ends)))
+
+    def __repr__(self):
+        return 'RangeSet(' + repr(self.ranges()) + ')'
+
+#ALPHABET as ranges, used as the transition label of '.'
+ALPHABET_RANGES = RangeSet.from_characters(ALPHABET)
+
+#largest code point
+MAX_CODE_POINT = 0x10FFFF
+
+class SymbolClassMap:
+    """Maps characters to symbol classes using intervals of code points
 
     Attributes
     ----------
+    self.starts : list (int)
+        increasing code points, self.starts[0] is 0
 
-    self.transitions : dict (str, set)
-        set of nodes reachable from self with the key
+    self.classes : list (int)
+        the characters with code points in [self.starts[i],
+        self.starts[i+1]) are in class self.classes[i], -1 if they have no
+        class. Adjacent intervals have different classes.
 
+    Notes
+    -----
+    Lookups are binary searches, so the size and the lookup time depend on
+    the number of intervals and not on the number of characters. Supports
+    the read-only dict operations used with dicts of symbol classes, and
+    compares equal to the dict with the same mapping.
     """
-    def __init__(self, transitions={}):
-        self.transitions = copy.deepcopy(transitions)
+    def __init__(self, intervals=()):
+        """
+        Parameters
+        ----------
+        intervals : iterable ((int, int, int))
+            (first, last, class) for sorted non-overlapping inclusive ranges
+            of code points
+        """
+        self.starts = [0]
+        self.classes = [-1]
+        end = 0
+        for first, last, symbol_class in intervals:
+            if first < end or last < first:
+                raise ValueError("intervals must be sorted and non-overlapping")
+            self.append(first, symbol_class)
+            self.append(last + 1, -1)
+            end = last + 1
+
+    def append(self, start, symbol_class):
+        """Set the class of the code points from start on
 
-    def add_transition(self, target, symbol):
-        if symbol in self.transitions:
-            self.transitions[symbol].add(target)
-        else:
-            self.transitions[symbol] = {target}
+        Notes
+        -----
+        start must not be smaller than the last start.
+        """
+        if start > MAX_CODE_POINT:
+            return
+        if self.starts[-1] == start:
+            self.classes[-1] = symbol_class
+            if len(self.classes) > 1 and self.classes[-2] == symbol_class:
+                self.starts.pop()
+                self.classes.pop()
+        elif self.classes[-1] != symbol_class:
+            self.starts.append(start)
+            self.classes.append(symbol_class)
 
-    def transitions_with_symbol(self, symbol):
-        if symbol in self.transitions:
-            return list(self.transitions[symbol])
-        else:
-            return []
+    @classmethod
+    def from_dict(cls, symbol_classes):
+        """Construct the map of a dict (str, int)
+        """
+        return cls((ord(x), ord(x), c)
+                   for x, c in sorted(symbol_classes.items()))
 
-#TODO can be removed
-    def transition_list(self):
-        """Returns list of transitions from self
+    @classmethod
+    def from_boundaries(cls, starts, classes):
+        """Construct the map from the lists self.starts and self.classes
+        """
+        if len(starts) == 0 or len(starts) != len(classes) or starts[0] != 0:
+            raise ValueError("invalid symbol class boundaries")
+        result = cls()
+        result.classes = [classes[0]]
+        for i in range(1, len(starts)):
+            if starts[i] <= starts[i - 1]:
+                raise ValueError("invalid symbol class boundaries")
+            result.append(starts[i], classes[i])
+        return result
+
+    def get(self, symbol, default=None):
+        if len(symbol) != 1:
+            return default
+        symbol_class = self.classes[bisect_right(self.starts, ord(symbol)) - 1]
+        return default if symbol_class < 0 else symbol_class
+
+    def __getitem__(self, symbol):
+        symbol_class = self.get(symbol)
+        if symbol_class is None:
+            raise KeyError(symbol)
+        return symbol_class
+
+    def __contains__(self, symbol):
+        return self.get(symbol) is not None
+
+    def intervals(self):
+        """Returns (first, last, class) of the intervals having a class
+        """
+        result = []
+        for i in range(len(self.starts)):
+            if self.classes[i] >= 0:
+                last = self.starts[i + 1] - 1 if i + 1 < len(self.starts) \
+                    else MAX_CODE_POINT
+                result.append((self.starts[i], last, self.classes[i]))
+        return result
+
+    def n_classes(self):
+        """Returns the number of distinct classes
+        """
+        return len({x for x in self.classes if x >= 0})
+
+    def items(self):
+        """Returns the (symbol, class) pairs, one per character
+        """
+        return [(chr(code), symbol_class)
+                for first, last, symbol_class in self.intervals()
+                for code in range(first, last + 1)]
+
+    def __len__(self):
+        return sum(last - first + 1 for first, last, _ in self.intervals())
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            other = SymbolClassMap.from_dict(other)
+        if not isinstance(other, SymbolClassMap):
+            return NotImplemented
+
+        return self.starts == other.starts and self.classes == other.classes
+
+    def __hash__(self):
+        return hash((tuple(self.starts), tuple(self.classes)))
+
+    def __repr__(self):
+        return 'SymbolClassMap(' + repr(self.intervals()) + ')'
+
+class CompactNFA:
+    """Transitions of a compiled NFA stored in flat arrays
+
+    Attributes
+    ----------
+    self.n_nodes : int
+
+    self.labels : list (str or RangeSet)
+        distinct transition labels, self.labels[0] is ''
+
+    self.symbol_ids : dict (str, int)
+        index of every character label in self.labels
+
+    self.range_ids : list (int)
+        indexes of the RangeSet labels in self.labels
+
+    self.offsets : array ('i')
+        the transitions from node i are at indexes
+        self.offsets[i], ..., self.offsets[i+1]-1 of the arrays below
+
+    self.targets : array ('i')
+        end node of every transition
+
+    self.label_ids : array ('i')
+        index of the label of every transition in self.labels
+
+    self.matching : dict (str, frozenset (int))
+        memoized label ids matching a symbol, see matching_labels
+
+    Notes
+    -----
+    The transitions are stored in compressed sparse row form, so a node
+    costs one offset instead of a dict of sets of targets. The arrays
+    and labels are plain data, so the object can be pickled and sent to
+    other processes.
+    """
+    __slots__ = ['n_nodes', 'labels', 'symbol_ids', 'range_ids', 'offsets',
+                 'targets', 'label_ids', 'matching']
+
+    def __init__(self, n_nodes, transitions):
+        """
+        Parameters
+        ----------
+        n_nodes : int
+
+        transitions : list ((int, int, str or RangeSet))
+            see NFA
+        """
+        self.n_nodes = n_nodes
+        self.labels = ['']
+        self.symbol_ids = {'': 0}
+        self.range_ids = []
+        #ids[label] = index of label in self.labels
+        ids = {'': 0}
+
+        #counting sort of the transitions by the start node
+        self.offsets = array('i', [0 for i in range(n_nodes + 1)])
+        for start, end, label in transitions:
+            self.offsets[start + 1] += 1
+        for i in range(n_nodes):
+            self.offsets[i + 1] += self.offsets[i]
+
+        self.targets = array('i', [0 for x in transitions])
+        self.label_ids = array('i', [0 for x in transitions])
+        position = self.offsets[:-1]
+        for start, end, label in transitions:
+            label_id = ids.get(label)
+            if label_id is None:
+                label_id = len(self.labels)
+                ids[label] = label_id
+                self.labels.append(label)
+                if isinstance(label, RangeSet):
+                    self.range_ids.append(label_id)
+                else:
+                    self.symbol_ids[label] = label_id
+
+            k = position[start]
+            position[start] += 1
+            self.targets[k] = end
+            self.label_ids[k] = label_id
+
+        self.matching = {}
+
+    def matching_labels(self, symbol):
+        """Returns the ids of the labels matching symbol
+
+        Parameters
+        ----------
+        symbol : str
+            a character or '' for the empty string transitions
 
         Returns
         -------
-            result : list of tuples
-                result[i][0]: end
-                result[i][1]: symbol
+        label_ids : frozenset (int)
         """
+        label_ids = self.matching.get(symbol)
+        if label_ids is None:
+            label_ids = {x for x in self.range_ids if symbol in self.labels[x]}
+            if symbol in self.symbol_ids:
+                label_ids.add(self.symbol_ids[symbol])
+            label_ids = frozenset(label_ids)
+            self.matching[symbol] = label_ids
+
+        return label_ids
+
+    def transitions_with_symbol(self, node_id, symbol):
+        """Returns the nodes reachable from node_id with symbol
+
+        Parameters
+        ----------
+        node_id : int
+
+        symbol : str
 
+        Returns
+        -------
+        result : list (int)
+        """
+        label_ids = self.matching_labels(symbol)
         result = []
-        for symbol, target in self.transitions.items():
-                result.append((target, symbol))
+        if not label_ids:
+            return result
+
+        targets = self.targets
+        node_label_ids = self.label_ids
+        for k in range(self.offsets[node_id], self.offsets[node_id + 1]):
+            if node_label_ids[k] in label_ids and targets[k] not in result:
+                result.append(targets[k])
 
         return result
 
+    def transition_list(self):
+        """Returns the transitions as a list ((int, int, str or RangeSet))
 
-    def copy(self):
-        return NFANode(self.transitions)
+        Notes
+        -----
+        The transitions are sorted by the start node, see NFA.
+        """
+        labels = self.labels
+        targets = self.targets
+        label_ids = self.label_ids
+        offsets = self.offsets
+        return [(i, targets[k], labels[label_ids[k]])
+                for i in range(self.n_nodes)
+                for k in range(offsets[i], offsets[i + 1])]
 
 class NFA:
     """Implements non-deterministic finite automaton
@@ -289,22 +672,46 @@ class NFA:
     Notes
     -----
     The NFA objects can internally be in two states: compiled and not compiled.
-    Compilation refers to generating a list of NFANode objects according
-    to the self.transitions. The generated list of NFANode objects can then
-    be used to evaluate the NFA.
+    Compilation refers to generating a CompactNFA according to the
+    self.transitions. The generated CompactNFA can then be used to evaluate
+    the NFA.
 
     The rationale behind compilation is that the list of transitions is easier
     to handle when performing operations on NFAs (concatenation, union, ...)
-    but the list of NFANodes is easier to handle when evaluating the NFA.
+    but the transitions grouped by node are easier to handle when evaluating
+    the NFA.
+
+    A compiled NFA does not keep the list of transitions, since the tuples
+    take several times the memory of the CompactNFA. self.transitions then
+    rebuilds the list from self.compact on every access.
     """
     def __init__(self, n_nodes, start_node, accepted_nodes, transitions):
         self.n_nodes = n_nodes
         self.start_node = start_node
         self.accepted_nodes = accepted_nodes.copy()
-        self.transitions = transitions.copy()
+        self._transitions = transitions.copy()
 
         self.compiled = False
-        self.nodes = None
+        self.compact = None
+        self.closure_offsets = None
+        self.closure_nodes = None
+        self.bit_tables = None
+        self.range_labels = None
+        self.symbol_bit_tables = None
+        self.accept_mask = 0
+
+    @property
+    def transitions(self):
+        """List of the transitions (start, end, label), see Notes of NFA
+        """
+        if self._transitions is None:
+            return self.compact.transition_list()
+        return self._transitions
+
+    @transitions.setter
+    def transitions(self, transitions):
+        self._transitions = transitions
+
     @classmethod
     def union_of_characters(cls, characters):
         """Construct a small NFA for a set of characters
@@ -313,23 +720,46 @@ class NFA:
         ----------
         characters : list(str)
 
+        Notes
+        -----
+        Several characters are stored as one transition labeled with a
+        RangeSet. The empty string gets its own transition.
         """
-        transitions = [(0, 1, x) for x in characters]
-        return NFA(2, 0, 1, transitions)
+        symbols = [x for x in characters if x != '']
+        if len(symbols) > 1:
+            transitions = [(0, 1, RangeSet.from_characters(symbols))]
+        else:
+            transitions = [(0, 1, x) for x in symbols]
+        if '' in characters:
+            transitions.append((0, 1, ''))
+        return NFA(2, 0, [1], transitions)
 
-    def evaluate(self, s):
+    def evaluate(self, s, engine='nodes'):
         """Determine if the NFA accepts string s
+
+        Parameters
+        ----------
+        s : str
+
+        engine : str
+            'nodes' simulates the NFA with lists of active nodes and
+            'bitset' with the bit-parallel tables, see evaluate_bitset
         """
-        if not compiled:
+        if engine == 'bitset':
+            return self.evaluate_bitset(s)
+        elif engine != 'nodes':
+            raise ValueError("unknown engine " + repr(engine))
+
+        if not self.compiled:
             self.compile()
 
         node_list = [self.start_node]
 
-        node_list = reachable_with_empty(node_list)
+        node_list = self.reachable_with_empty(node_list)
 
         for i in range(len(s)):
-            node_list = reachable_with_symbol(node_list, s[i])
-            node_list = reachable_with_empty(node_list)
+            node_list = self.reachable_with_symbol(node_list, s[i])
+            node_list = self.reachable_with_empty(node_list)
 
         for x in node_list:
             if x in self.accepted_nodes:
@@ -337,6 +767,196 @@ class NFA:
 
         return False
 
+    def evaluate_bitset(self, s):
+        """Determine if the NFA accepts string s using bit-parallel simulation
+
+        Notes
+        -----
+        The set of active nodes is stored as one integer where bit i is set
+        if node i is active. The set is split into chunks of 8 bits and for
+        every symbol and chunk there is a table (see compute_bit_tables)
+        giving the nodes reached from any combination of active nodes in the
+        chunk. A step is therefore a few shifts, ANDs and ORs per chunk
+        containing nodes with transitions with the symbol.
+
+        The tables are computed on the first use, so the other engines do
+        not pay for them.
+        """
+        return self.reachable_bitset(s) & self.accept_mask != 0
+
+    def reachable_bitset(self, s, mask=None):
+        """Returns the nodes reachable by reading s as a bitset
+
+        Parameters
+        ----------
+        s : str
+
+        mask : int or None
+            bitset of the active nodes before reading s, None for the
+            closure of the start node
+
+        Returns
+        -------
+        mask : int
+            bit i is set if node i is active after reading s
+        """
+        if not self.compiled:
+            self.compile()
+        if self.bit_tables is None:
+            self.compute_bit_tables()
+
+        bit_tables = self.bit_tables
+        if mask is None:
+            mask = list_to_bitset(self.closure(self.start_node))
+
+        symbol_bit_tables = self.symbol_bit_tables
+
+        for symbol in s:
+            if not mask:
+                break
+
+            tables = symbol_bit_tables.get(symbol)
+            if tables is None:
+                tables = list(bit_tables.get(symbol, ()))
+                for range_set in self.range_labels:
+                    if symbol in range_set:
+                        tables.extend(bit_tables[range_set])
+                symbol_bit_tables[symbol] = tables
+
+            new_mask = 0
+            for shift, low, table in tables:
+                new_mask |= table[mask >> shift & 0xFF] << low
+            mask = new_mask
+
+        return mask
+
+    def search(self, s, pos=0, prefix='', required=''):
+        """Find the leftmost-longest substring of s accepted by the NFA
+
+        Parameters
+        ----------
+        s : str
+
+        pos : int
+            index where the search starts
+
+        prefix : str
+            a string every match starts with, see literal_info
+
+        required : str
+            a string every match contains, see literal_info
+
+        Returns
+        -------
+        span : (int, int) or None
+            s[span[0]:span[1]] is the match, None if there is no match
+
+        Notes
+        -----
+        A single left-to-right pass. A thread is started from the start node
+        at every position until a match is found. Every active node keeps
+        only the leftmost start position of the threads reaching it. After
+        a match is found, new threads are not started and only threads
+        starting at or before the match are continued, since they can still
+        give a match further left or a longer one.
+
+        If prefix is given, threads are started only where str.find finds
+        the prefix, and when no threads are active the search jumps directly
+        to the next occurrence. If required is not found in s[pos:], there
+        is no match and the NFA is not simulated at all.
+        """
+        if not self.compiled:
+            self.compile()
+
+        if required and s.find(required, pos) == -1:
+            return None
+
+        compact = self.compact
+        closure = self.closure
+        accepted_nodes = set(self.accepted_nodes)
+        start_nodes = closure(self.start_node)
+
+        #next position where a thread is started, -1 if none
+        next_start = s.find(prefix, pos) if prefix else pos
+        if next_start == -1:
+            return None
+
+        #threads[node_id] = start position of the leftmost thread in node_id
+        threads = {}
+        match = None
+        i = next_start
+        while True:
+            if match is None and i == next_start:
+                for x in start_nodes:
+                    if x not in threads:
+                        threads[x] = i
+                next_start = s.find(prefix, i + 1) if prefix else i + 1
+
+            for x, start in threads.items():
+                if x in accepted_nodes:
+                    if match is None or start < match[0] \
+                       or (start == match[0] and i > match[1]):
+                        match = (start, i)
+
+            if match is not None:
+                threads = {x: start for x, start in threads.items()
+                           if start <= match[0]}
+
+            if i >= len(s):
+                return match
+
+            if len(threads) == 0:
+                if match is not None or next_start == -1:
+                    return match
+                i = next_start
+                continue
+
+            new_threads = {}
+            symbol = s[i]
+            for x, start in threads.items():
+                for y in compact.transitions_with_symbol(x, symbol):
+                    for z in closure(y):
+                        if start < new_threads.get(z, len(s) + 1):
+                            new_threads[z] = start
+
+            threads = new_threads
+            i += 1
+
+    def finditer(self, s, pos=0, prefix='', required=''):
+        """Yield the spans of non-overlapping leftmost-longest matches
+
+        Parameters
+        ----------
+        s : str
+
+        pos : int
+            index where the search starts
+
+        prefix, required : str
+            see search
+
+        Yields
+        ------
+        span : (int, int)
+        """
+        while pos <= len(s):
+            match = self.search(s, pos, prefix, required)
+            if match is None:
+                return
+            yield match
+            #continue after an empty match from the next position
+            pos = match[1] if match[1] > match[0] else match[1] + 1
+
+    def findall(self, s, pos=0, prefix='', required=''):
+        """Return the non-overlapping leftmost-longest matches
+
+        Returns
+        -------
+        matches : list (str)
+        """
+        return [s[start:end]
+                for start, end in self.finditer(s, pos, prefix, required)]
+
     def reachable_with_symbol(self, node_list, symbol):
         """Returns states which are reachable with symbol. See Notes.
 
@@ -359,20 +979,19 @@ class NFA:
         """
 
         new_node_list = []
-        id_active = [False for i in range(self.n_nodes)]
+        seen = set()
 
-        for i in range(len(node_list)):
-            node_id = node_list[i]
-            neighbours = self.nodes[node_id].transitions_with_symbol(symbol)
+        for node_id in node_list:
+            neighbours = self.compact.transitions_with_symbol(node_id, symbol)
             for x in neighbours:
-                if not id_active[x]:
+                if x not in seen:
                     new_node_list.append(x)
-                    id_active[x] = True
+                    seen.add(x)
 
         return new_node_list
 
-    def reachable_with_empty(self, node_list):
-        """Returns states that are reachable without consuming any symbols.
+    def successor_mask(self, node_list, symbol):
+        """Returns the nodes reachable with symbol as a closed bitset
 
         Parameters
         ----------
@@ -380,6 +999,34 @@ class NFA:
 
         symbol : str
 
+        Returns
+        -------
+        mask : int
+            bit i is set if node i is reachable from node_list by reading
+            symbol and following any number of empty string transitions
+
+        Notes
+        -----
+        Equal to reachable_with_empty(reachable_with_symbol(node_list,
+        symbol)) as a bitset, but only the transitions from node_list are
+        visited and the bitset is built once from the closures.
+        """
+        closure = self.closure
+        transitions_with_symbol = self.compact.transitions_with_symbol
+        nodes = []
+        for x in node_list:
+            for y in transitions_with_symbol(x, symbol):
+                nodes.extend(closure(y))
+
+        return list_to_bitset(nodes)
+
+    def reachable_with_empty(self, node_list):
+        """Returns states that are reachable without consuming any symbols.
+
+        Parameters
+        ----------
+        node_list : list (int)
+
         Returns
         -------
         new_node_list : list(int)
@@ -388,68 +1035,343 @@ class NFA:
         -----
         Also returns every node in node_list. Compare with
         reachable_with_symbol.
+
+        Follows any number of empty string edges by combining the closures
+        precomputed in compile.
         """
 
-        new_node_list = reachable_with_symbol(node_list, '')
-        #it is not necessary to use the empty string edges
-        new_node_list.extend(node_list)
-        #remove duplicates
-        new_node_list = list(set(new_node_list))
-        return new_node_list
+        closure = self.closure
+        nodes = set()
+        for x in node_list:
+            nodes.update(closure(x))
 
-    def copy(self):
-        return NFA(self.n_nodes, self.start_node, self.accepted_nodes,
-                  self.transitions)
+        return sorted(nodes)
 
-    def compile(self):
-        """Construct a graph of NFANodes with transitions from self.transitions
+    def symbol_partition(self):
+        """Partition the symbols into classes behaving identically
 
-        """
-        self.nodes = [NFANode() for i in range(self.n_nodes)]
-        self.process_transitions()
-        self.compiled = True
+        Returns
+        -------
+        symbol_classes : SymbolClassMap
+            class of each symbol having a transition
 
-    def process_transitions(self):
-        """Adds transitions to node objects
+        representatives : list (str)
+            representatives[j] is the smallest symbol of class j
 
+        Notes
+        -----
+        Two symbols are in the same class if they label exactly the same
+        transitions. Then they lead to the same states from every set of
+        states, so the DFA needs only one column per class. The classes are
+        numbered in the order of their smallest symbol.
+
+        The labels are handled as ranges of code points. The boundaries of
+        all ranges split the code points into intervals, and every symbol
+        of an interval has the same transitions, so the signatures are
+        computed once per interval with a sweep over the boundaries. The
+        result is stored as intervals, so the time and size only depend on
+        the number of ranges.
         """
-        for x in self.transitions:
-            self.nodes[x[0]].add_transition(x[1], x[2])
-
-    def apply_offset(self, offset):
-        """Shifts _all_ indexes by offset.
+        #events[code] = edges starting and ending at code
+        events = {}
+        for start, end, symbol in self.transitions:
+            if symbol == '':
+                continue
+            if isinstance(symbol, RangeSet):
+                ranges = zip(symbol.starts, symbol.ends)
+            else:
+                ranges = [(ord(symbol), ord(symbol))]
+            for first, last in ranges:
+                events.setdefault(first, ([], []))[0].append((start, end))
+                events.setdefault(last + 1, ([], []))[1].append((start, end))
+
+        boundaries = sorted(events)
+        #active[edge] = number of ranges of the edge covering the interval
+        active = {}
+        classes = {}
+        representatives = []
+        intervals = []
+        for k in range(len(boundaries) - 1):
+            starting, ending = events[boundaries[k]]
+            for edge in ending:
+                active[edge] -= 1
+                if active[edge] == 0:
+                    del active[edge]
+            for edge in starting:
+                active[edge] = active.get(edge, 0) + 1
+            if len(active) == 0:
+                continue
+
+            signature = frozenset(active)
+            if signature not in classes:
+                classes[signature] = len(representatives)
+                representatives.append(chr(boundaries[k]))
+            intervals.append((boundaries[k], boundaries[k + 1] - 1,
+                              classes[signature]))
+
+        return SymbolClassMap(intervals), representatives
+
+    def to_dfa(self, unanchored=False):
+        """Construct an equivalent DFA using the subset construction
 
         Parameters
         ----------
-            offset : non-negative integer
+        unanchored : bool
+            if True, the DFA accepts every string having a suffix accepted
+            by the NFA, that is, it is in an accepted state after reading the
+            end of any match. Used for searching.
+
+        Returns
+        -------
+        dfa : DFA
 
         Notes
         -----
-        Used to make the nodes in two graphs non-overlapping.
+        Every DFA state corresponds to a set of NFA states. Only the sets
+        reachable from the start node are constructed. The empty set is not
+        stored as a state; transitions to it are marked by -1 in DFA.table.
+
+        In the unanchored DFA, the closure of the start node is added to
+        every state, so the empty set is never reached. Symbols not in
+        DFA.symbol_classes lead to the start state instead of rejecting.
 
+        The columns of the table are the symbol classes of symbol_partition,
+        so the table has one column per class instead of one per symbol.
         """
+        if not self.compiled:
+            self.compile()
 
-        self.compiled = False
+        symbol_classes, symbols = self.symbol_partition()
+
+        #the sets of NFA states are stored as bitsets, see successor_mask
+        start = list_to_bitset(self.closure(self.start_node))
+        state_ids = {start: 0}
+        state_masks = [start]
+        table = array('i')
+
+        i = 0
+        while i < len(state_masks):
+            node_list = bitset_to_list(state_masks[i])
+            for symbol in symbols:
+                new_mask = self.successor_mask(node_list, symbol)
+                if unanchored:
+                    new_mask |= start
+                elif new_mask == 0:
+                    table.append(-1)
+                    continue
+
+                if new_mask not in state_ids:
+                    state_ids[new_mask] = len(state_masks)
+                    state_masks.append(new_mask)
+
+                table.append(state_ids[new_mask])
+            i += 1
 
-        if offset < 0:
-            raise ValueError("offset cannot be negative")
+        accept_mask = 0
+        for x in self.accepted_nodes:
+            accept_mask |= 1 << x
+        accepted = [x & accept_mask != 0 for x in state_masks]
 
-        self.n_nodes += offset
-        self.start_node += offset
+        return DFA(0, accepted, symbol_classes, table, unanchored)
 
-        for i in range(len(self.transitions)):
-            self.transitios[i][0] += offset
-            self.transitios[i][1] += offset
+    def to_lazy_dfa(self, max_cache_size=1024):
+        """Construct a DFA whose states are built only when needed
 
-    def union(self, other):
-        """Return union as a new NFA
+        Parameters
+        ----------
+        max_cache_size : non-negative integer
+            maximum number of memoized transitions
+
+        Returns
+        -------
+        lazy_dfa : LazyDFA
+        """
+        return LazyDFA(self, max_cache_size)
+
+    def reverse(self):
+        """Return a new NFA accepting the reversed strings
+
+        Notes
+        -----
+        Every transition is flipped. A new start node has empty string
+        transitions to the old accepted nodes, and the old start node is
+        the only accepted node.
+        """
+        transitions = [(end, start, symbol)
+                       for start, end, symbol in self.transitions]
+        new_start = self.n_nodes
+        transitions.extend([(new_start, x, '') for x in self.accepted_nodes])
+
+        return NFA(self.n_nodes + 1, new_start, [self.start_node],
+                   transitions)
+
+    def copy(self):
+        return NFA(self.n_nodes, self.start_node, self.accepted_nodes,
+                  self.transitions)
+
+    def compile(self):
+        """Construct a CompactNFA with transitions from self.transitions
+
+        """
+        self.compact = CompactNFA(self.n_nodes, self.transitions)
+        self._transitions = None
+        self.compute_closures()
+        self.bit_tables = None
+        self.range_labels = None
+        self.symbol_bit_tables = None
+
+        self.accept_mask = 0
+        for x in self.accepted_nodes:
+            self.accept_mask |= 1 << x
+
+        self.compiled = True
+
+    def closure(self, node_id):
+        """Returns the nodes reachable from node_id with empty string edges
+
+        Returns
+        -------
+        nodes : array ('i')
+            sorted node ids, node_id included
+        """
+        offsets = self.closure_offsets
+        return self.closure_nodes[offsets[node_id]:offsets[node_id + 1]]
+
+    def compute_closures(self):
+        """Computes the epsilon closure of every node as a sorted node list
+
+        Notes
+        -----
+        The closure of node i, see closure, is stored at indexes
+        self.closure_offsets[i], ..., self.closure_offsets[i+1]-1 of
+        self.closure_nodes, as the transitions in CompactNFA. Every node is
+        in its own closure, so a node without empty string edges costs two
+        integers. Bitsets are built from the lists only where a step needs
+        them, see successor_mask.
+
+        The nodes are processed in order, so the closures of the already
+        processed nodes are complete and can be reused.
+        """
+        transitions_with_symbol = self.compact.transitions_with_symbol
+        offsets = array('i', [0])
+        nodes = array('i')
+
+        for i in range(self.n_nodes):
+            empty_targets = transitions_with_symbol(i, '')
+            if len(empty_targets) == 0:
+                nodes.append(i)
+                offsets.append(len(nodes))
+                continue
+
+            closure = {i}
+            stack = [i]
+            while len(stack) > 0:
+                node_id = stack.pop()
+                for x in transitions_with_symbol(node_id, ''):
+                    if x in closure:
+                        continue
+                    if x < i:
+                        closure.update(nodes[offsets[x]:offsets[x + 1]])
+                    else:
+                        closure.add(x)
+                        stack.append(x)
+
+            nodes.extend(sorted(closure))
+            offsets.append(len(nodes))
+
+        self.closure_offsets = offsets
+        self.closure_nodes = nodes
+
+    def compute_bit_tables(self):
+        """Computes the transition tables used by evaluate_bitset
+
+        Notes
+        -----
+        self.bit_tables[symbol] is a list of triples (shift, low, table).
+        The active nodes mask >> shift & 0xFF selects the active nodes
+        shift, ..., shift+7 and table[i] << low is the bitset of nodes
+        reachable from the nodes selected by i with symbol, epsilon closure
+        included. Only chunks containing nodes with a transition with the
+        symbol are stored.
+
+        low is the smallest node reachable from the chunk, so the entries
+        only span the nodes between the successors of the chunk instead of
+        the whole NFA. Called by reachable_bitset when first needed.
+
+        Transitions labeled with a RangeSet get their own tables under the
+        RangeSet. The tables of a symbol are combined with the tables of the
+        RangeSets containing it in self.symbol_bit_tables when the symbol is
+        first read.
+        """
+        #successors[symbol][node] = nodes reachable with the symbol
+        successors = {}
+        for start, end, symbol in self.transitions:
+            if symbol == '':
+                continue
+            symbol_successors = successors.setdefault(symbol, {})
+            symbol_successors[start] = (symbol_successors.get(start, 0)
+                                        | list_to_bitset(self.closure(end)))
+
+        self.bit_tables = {}
+        for symbol, symbol_successors in successors.items():
+            chunks = sorted({x >> 3 for x in symbol_successors})
+            tables = []
+            for chunk in chunks:
+                chunk_successors = [symbol_successors.get((chunk << 3) + j, 0)
+                                    for j in range(8)]
+                union = 0
+                for x in chunk_successors:
+                    union |= x
+                low = (union & -union).bit_length() - 1
+                chunk_successors = [x >> low for x in chunk_successors]
+
+                table = [0 for i in range(256)]
+                for i in range(1, 256):
+                    low_bit = i & -i
+                    table[i] = (table[i ^ low_bit]
+                                | chunk_successors[low_bit.bit_length() - 1])
+                tables.append((chunk << 3, low, table))
+
+            self.bit_tables[symbol] = tables
+
+        self.range_labels = [x for x in self.bit_tables
+                             if isinstance(x, RangeSet)]
+        self.symbol_bit_tables = {}
+
+    def apply_offset(self, offset):
+        """Shifts _all_ indexes by offset.
+
+        Parameters
+        ----------
+            offset : non-negative integer
+
+        Notes
+        -----
+        Used to make the nodes in two graphs non-overlapping.
+
+        """
+
+        self.compiled = False
+
+        if offset < 0:
+            raise ValueError("offset cannot be negative")
+
+        self.n_nodes += offset
+        self.start_node += offset
+        self.accepted_nodes = [x + offset for x in self.accepted_nodes]
+
+        self.transitions = [(start + offset, end + offset, symbol)
+                            for start, end, symbol in self.transitions]
+
+    def union(self, other):
+        """Return union as a new NFA
         """
         self_copy = self.copy()
         other_copy = other.copy()
         #make the node ids non-overlapping
         other_copy.apply_offset(self_copy.n_nodes)
 
-        self_copy.n_nodes += other_copy.n_nodes
+        self_copy.n_nodes = other_copy.n_nodes
         self_copy.transitions.extend(other_copy.transitions)
 
         self_old_start = self_copy.start_node
@@ -480,8 +1402,8 @@ class NFA:
         #make sure the node ids are not overlapping
         other_copy.apply_offset(self_copy.n_nodes)
 
-        self_copy.n_nodes += other_copy.n_nodes
-        self_copy.add_transitions(other_copy.transitions)
+        self_copy.n_nodes = other_copy.n_nodes
+        self_copy.transitions.extend(other_copy.transitions)
 
         new_edges = []
         for x in self_copy.accepted_nodes:
@@ -527,6 +1449,693 @@ class NFA:
         """
         return self.union(NFA.union_of_characters(['']))
 
+#part of an NFA under construction, see NFABuilder
+Fragment = namedtuple('Fragment', ['start', 'accepted'])
+
+class NFABuilder:
+    """Builds an NFA incrementally from fragments without copying
+
+    Attributes
+    ----------
+    self.n_nodes : int
+        number of allocated nodes
+
+    self.transitions : list ((int, int, str or RangeSet))
+        transitions of all fragments
+
+    Notes
+    -----
+    The NFA methods union, concatenate, ... copy their operands and shift
+    every transition with apply_offset, so building an NFA for a deep
+    expression copies the transitions once per level. Here every node id is
+    allocated once and all fragments share self.transitions. A Fragment is
+    only its start node and its list of accepted nodes, and the operations
+    add the connecting empty string transitions and reuse the lists of the
+    operands. Thus building is linear in the size of the expression.
+
+    The operands are consumed: a fragment should be used in at most one
+    operation, and build should be called once.
+    """
+    def __init__(self):
+        self.n_nodes = 0
+        self.transitions = []
+
+    def new_node(self):
+        """Allocate a node and return its id
+        """
+        self.n_nodes += 1
+        return self.n_nodes - 1
+
+    def symbols(self, label):
+        """Return a fragment matching one symbol
+
+        Parameters
+        ----------
+        label : str or RangeSet
+            '' for a fragment matching only the empty string
+        """
+        start = self.new_node()
+        if label == '':
+            return Fragment(start, [start])
+        end = self.new_node()
+        self.transitions.append((start, end, label))
+        return Fragment(start, [end])
+
+    def add(self, nfa):
+        """Copy an NFA into the builder and return it as a fragment
+        """
+        offset = self.n_nodes
+        self.n_nodes += nfa.n_nodes
+        self.transitions.extend([(start + offset, end + offset, symbol)
+                                 for start, end, symbol in nfa.transitions])
+        return Fragment(nfa.start_node + offset,
+                        [x + offset for x in nfa.accepted_nodes])
+
+    def union(self, first, second):
+        """Return a fragment for first|second
+        """
+        start = self.new_node()
+        self.transitions.append((start, first.start, ''))
+        self.transitions.append((start, second.start, ''))
+        first.accepted.extend(second.accepted)
+        return Fragment(start, first.accepted)
+
+    def concatenate(self, first, second):
+        """Return a fragment for first followed by second
+        """
+        for x in first.accepted:
+            self.transitions.append((x, second.start, ''))
+        return Fragment(first.start, second.accepted)
+
+    def star(self, fragment):
+        """Return a fragment for fragment*
+        """
+        start = self.new_node()
+        fragment.accepted.append(start)
+        for x in fragment.accepted:
+            self.transitions.append((x, fragment.start, ''))
+        return Fragment(start, fragment.accepted)
+
+    def plus(self, fragment):
+        """Return a fragment for fragment+
+        """
+        for x in fragment.accepted:
+            self.transitions.append((x, fragment.start, ''))
+        return fragment
+
+    def question(self, fragment):
+        """Return a fragment for fragment?
+        """
+        start = self.new_node()
+        self.transitions.append((start, fragment.start, ''))
+        fragment.accepted.append(start)
+        return Fragment(start, fragment.accepted)
+
+    def build(self, fragment):
+        """Return the NFA of fragment
+
+        Returns
+        -------
+        nfa : NFA
+            contains all nodes of the builder, the ones not reachable from
+            the start of fragment are unused
+        """
+        return NFA(self.n_nodes, fragment.start, fragment.accepted,
+                   self.transitions)
+
+class DFA:
+    """Implements deterministic finite automaton
+
+    Attributes
+    ----------
+    self.n_states : int
+
+    self.start_state : int
+
+    self.accepted : list (bool)
+        self.accepted[i] is True if state i is an accepted state
+
+    self.symbol_classes : SymbolClassMap
+        column of each symbol in self.table
+
+    self.n_classes : int
+
+    self.byte_classes : array ('i')
+        self.byte_classes[c] is the class of chr(c) for c < 256 or -1 if it
+        has no class
+
+    self.table : array ('i') or memoryview
+        self.table[i*self.n_classes + j] is the state reached from state i
+        with a symbol of class j or -1 if no state can be reached. A
+        memoryview is used as is, see from_buffer.
+
+    self.unanchored : bool
+        True if the DFA is used for searching, see NFA.to_dfa
+
+    Notes
+    -----
+    Symbols not in self.symbol_classes have no transitions from any state,
+    unless self.unanchored is True. Then they lead to the start state.
+
+    The classes of the first 256 characters are looked up from
+    self.byte_classes, and self.symbol_classes is only used as a fallback
+    for the other characters. symbol_classes can also be given to the
+    constructor as a dict (str, int).
+    """
+    def __init__(self, start_state, accepted, symbol_classes, table,
+                 unanchored=False):
+        self.n_states = len(accepted)
+        self.start_state = start_state
+        self.accepted = list(accepted)
+        if isinstance(symbol_classes, SymbolClassMap):
+            self.symbol_classes = symbol_classes
+        else:
+            self.symbol_classes = SymbolClassMap.from_dict(symbol_classes)
+        self.n_classes = self.symbol_classes.n_classes()
+        self.byte_classes = array('i', [self.symbol_classes.get(chr(c), -1)
+                                        for c in range(256)])
+        if isinstance(table, memoryview):
+            self.table = table
+        else:
+            self.table = array('i', table)
+        self.unanchored = unanchored
+
+        if len(self.table) != self.n_states * self.n_classes:
+            raise ValueError("table size does not match the number of states "
+                             "and symbol classes")
+
+    def to_bytes(self):
+        """Serialize the DFA
+
+        Returns
+        -------
+        data : bytes
+
+        Notes
+        -----
+        The format consists of
+            header : DFA_HEADER with DFA_MAGIC, DFA_FORMAT_VERSION, flags
+                (1 if unanchored), n_states, start_state, n_classes and the
+                number of intervals of the symbol map
+            symbol map : (start, class) pairs of self.symbol_classes as
+                32-bit integers, see SymbolClassMap
+            accepted : one byte per state, padded to a multiple of 4 bytes
+            table : self.table as 32-bit integers
+        All integers are little-endian. See from_buffer.
+        """
+        symbols = array('i')
+        for start, symbol_class in zip(self.symbol_classes.starts,
+                                       self.symbol_classes.classes):
+            symbols.append(start)
+            symbols.append(symbol_class)
+        table = array('i', self.table)
+        if sys.byteorder == 'big':
+            symbols.byteswap()
+            table.byteswap()
+
+        accepted = bytes(self.accepted)
+        padding = b'\0' * (-len(accepted) % 4)
+
+        header = DFA_HEADER.pack(DFA_MAGIC, DFA_FORMAT_VERSION,
+                                 int(self.unanchored), self.n_states,
+                                 self.start_state, self.n_classes,
+                                 len(self.symbol_classes.starts))
+        return b''.join([header, symbols.tobytes(), accepted, padding,
+                         table.tobytes()])
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """Load a DFA serialized with to_bytes
+
+        Parameters
+        ----------
+        buffer : bytes, mmap or other object supporting the buffer protocol
+
+        Returns
+        -------
+        dfa : DFA
+
+        Notes
+        -----
+        On little-endian machines the table is a memoryview of buffer and
+        is not copied, so DFAs loaded from a memory-mapped file by several
+        processes share the same pages. See load_dfa.
+        """
+        view = memoryview(buffer).cast('B')
+        if len(view) < DFA_HEADER.size:
+            raise ValueError("truncated DFA data")
+        magic, version, flags, n_states, start_state, n_classes, \
+            n_intervals = DFA_HEADER.unpack_from(view)
+        if magic != DFA_MAGIC:
+            raise ValueError("not a serialized DFA")
+        if version != DFA_FORMAT_VERSION:
+            raise ValueError("unsupported DFA format version " + str(version))
+
+        symbols_start = DFA_HEADER.size
+        accepted_start = symbols_start + 8 * n_intervals
+        table_start = accepted_start + n_states + (-n_states % 4)
+        table_end = table_start + 4 * n_states * n_classes
+        if len(view) != table_end:
+            raise ValueError("truncated DFA data")
+
+        symbols = array('i', view[symbols_start:accepted_start].tobytes())
+        if sys.byteorder == 'big':
+            symbols.byteswap()
+            table = array('i', view[table_start:table_end].tobytes())
+            table.byteswap()
+        else:
+            table = view[table_start:table_end].cast('i')
+
+        symbol_classes = SymbolClassMap.from_boundaries(symbols[0::2],
+                                                        symbols[1::2])
+        accepted = [x != 0 for x in view[accepted_start:
+                                         accepted_start + n_states]]
+
+        return cls(start_state, accepted, symbol_classes, table,
+                   flags & 1 == 1)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        #memoryviews of loaded tables cannot be pickled
+        state['table'] = array('i', self.table)
+        return state
+
+    def evaluate(self, s):
+        """Determine if the DFA accepts string s
+        """
+        symbol_classes = self.symbol_classes
+        byte_classes = self.byte_classes
+        n_classes = self.n_classes
+        table = self.table
+
+        state = self.start_state
+        for symbol in s:
+            code = ord(symbol)
+            if code < 256:
+                symbol_class = byte_classes[code]
+            else:
+                symbol_class = symbol_classes.get(symbol, -1)
+            if symbol_class < 0:
+                if not self.unanchored:
+                    return False
+                state = self.start_state
+                continue
+
+            state = table[state*n_classes + symbol_class]
+            if state < 0:
+                return False
+
+        return self.accepted[state]
+
+    def __eq__(self, other):
+        if not isinstance(other, DFA):
+            return NotImplemented
+
+        return self.start_state == other.start_state \
+            and self.accepted == other.accepted \
+            and self.symbol_classes == other.symbol_classes \
+            and self.table == other.table \
+            and self.unanchored == other.unanchored
+
+    def __hash__(self):
+        return hash((self.start_state, self.unanchored, tuple(self.accepted),
+                     self.symbol_classes,
+                     self.table.tobytes()))
+
+    def longest_match(self, s, pos=0):
+        """Find the longest prefix of s[pos:] accepted by the DFA
+
+        Returns
+        -------
+        end : int
+            s[pos:end] is the longest accepted prefix, -1 if there is none
+        """
+        symbol_classes = self.symbol_classes
+        byte_classes = self.byte_classes
+        n_classes = self.n_classes
+        table = self.table
+        accepted = self.accepted
+
+        state = self.start_state
+        end = pos if accepted[state] else -1
+        for i in range(pos, len(s)):
+            code = ord(s[i])
+            if code < 256:
+                symbol_class = byte_classes[code]
+            else:
+                symbol_class = symbol_classes.get(s[i], -1)
+            if symbol_class < 0:
+                break
+            state = table[state*n_classes + symbol_class]
+            if state < 0:
+                break
+            if accepted[state]:
+                end = i + 1
+
+        return end
+
+    def reverse_scan(self, s, pos=0):
+        """Run the DFA over s[pos:] from the end to the start
+
+        Parameters
+        ----------
+        s : str
+
+        pos : int
+
+        Returns
+        -------
+        positions : list (int)
+            the indexes i >= pos in increasing order where the DFA is in an
+            accepted state after reading s[i:] reversed
+
+        Notes
+        -----
+        For the unanchored DFA of a reversed NFA (see NFA.reverse), these
+        are the start positions of all matches in s.
+        """
+        symbol_classes = self.symbol_classes
+        byte_classes = self.byte_classes
+        n_classes = self.n_classes
+        table = self.table
+        accepted = self.accepted
+        start_state = self.start_state
+
+        positions = []
+        state = start_state
+        if accepted[state]:
+            positions.append(len(s))
+        for i in range(len(s) - 1, pos - 1, -1):
+            code = ord(s[i])
+            if code < 256:
+                symbol_class = byte_classes[code]
+            else:
+                symbol_class = symbol_classes.get(s[i], -1)
+            if symbol_class < 0:
+                if not self.unanchored:
+                    break
+                state = start_state
+            else:
+                state = table[state*n_classes + symbol_class]
+                if state < 0:
+                    break
+            if accepted[state]:
+                positions.append(i)
+
+        positions.reverse()
+        return positions
+
+    def minimize(self):
+        """Return the minimal equivalent DFA in a canonical form
+
+        Returns
+        -------
+        dfa : DFA
+
+        Notes
+        -----
+        The states are merged with Hopcroft's partition refinement in
+        O(n_states * n_classes * log(n_states)) time: a split relabels only
+        the smaller part of the block, so no state is relabeled more than
+        log(n_states) times. Then the symbol classes are merged if they have
+        identical columns, symbols without any transitions are dropped and
+        the classes are numbered in the order of their smallest symbol.
+        Finally the states are numbered in breadth-first order from the start
+        state, following the symbol classes in order.
+
+        The result only depends on the language of the DFA, so two DFAs
+        accept the same strings if and only if their minimized DFAs are
+        equal.
+        """
+        n_classes = self.n_classes
+        #complete the DFA with a dead state
+        dead = self.n_states
+        n_states = self.n_states + 1
+
+        def target(state, symbol_class):
+            if state == dead:
+                return dead
+            x = self.table[state*n_classes + symbol_class]
+            return dead if x < 0 else x
+
+        #inverse[j][q] = states reaching q with symbol class j
+        inverse = [[[] for q in range(n_states)] for j in range(n_classes)]
+        for state in range(n_states):
+            for j in range(n_classes):
+                inverse[j][target(state, j)].append(state)
+
+        accepted = {q for q in range(self.n_states) if self.accepted[q]}
+        rejected = [q for q in range(n_states) if q not in accepted]
+
+        #refinable partition: the states of block b are
+        #elements[first[b]:end[b]] and location[q] is the index of q in
+        #elements. marked[b] states moving into the splitter are swapped
+        #to the start of the block.
+        elements = sorted(accepted) + rejected
+        location = [0 for q in range(n_states)]
+        for k in range(n_states):
+            location[elements[k]] = k
+        first = []
+        end = []
+        block_of = [0 for q in range(n_states)]
+        for part in [len(accepted), n_states - len(accepted)]:
+            if part == 0:
+                continue
+            start = end[-1] if end else 0
+            for k in range(start, start + part):
+                block_of[elements[k]] = len(first)
+            first.append(start)
+            end.append(start + part)
+        marked = [0 for b in range(len(first))]
+
+        waiting = set(range(len(first)))
+        while len(waiting) > 0:
+            b = waiting.pop()
+            splitter = elements[first[b]:end[b]]
+            for j in range(n_classes):
+                touched = []
+                for q in splitter:
+                    for p in inverse[j][q]:
+                        i = block_of[p]
+                        if marked[i] == 0:
+                            touched.append(i)
+                        #swap p to the marked part of its block
+                        k = first[i] + marked[i]
+                        other = elements[k]
+                        elements[k] = p
+                        elements[location[p]] = other
+                        location[other] = location[p]
+                        location[p] = k
+                        marked[i] += 1
+
+                for i in touched:
+                    n_marked = marked[i]
+                    marked[i] = 0
+                    if n_marked == end[i] - first[i]:
+                        continue
+
+                    #the smaller part becomes the new block, so every
+                    #state is relabeled O(log n) times
+                    middle = first[i] + n_marked
+                    if n_marked <= end[i] - middle:
+                        new_first, new_end = first[i], middle
+                        first[i] = middle
+                    else:
+                        new_first, new_end = middle, end[i]
+                        end[i] = middle
+                    new_block = len(first)
+                    first.append(new_first)
+                    end.append(new_end)
+                    marked.append(0)
+                    for k in range(new_first, new_end):
+                        block_of[elements[k]] = new_block
+
+                    #if block i is waiting both parts are, otherwise the
+                    #smaller one is enough
+                    waiting.add(new_block)
+
+        n_blocks = len(first)
+        dead_block = block_of[dead]
+        representatives = [min(elements[first[b]:end[b]])
+                           for b in range(n_blocks)]
+
+        def block_target(block, symbol_class):
+            return block_of[target(representatives[block], symbol_class)]
+
+        #merge symbol classes with identical columns and drop the classes
+        #leading only to the dead block
+        columns = {}
+        for j in range(n_classes):
+            column = tuple(block_target(b, j) for b in range(n_blocks))
+            if any(x != dead_block for x in column):
+                columns.setdefault(column, []).append(j)
+
+        #smallest code point of every old class
+        smallest = {}
+        for code, last, j in self.symbol_classes.intervals():
+            smallest.setdefault(j, code)
+
+        merged = []
+        for old_class_list in columns.values():
+            code = min(smallest[j] for j in old_class_list)
+            merged.append((code, old_class_list[0], old_class_list))
+        merged.sort()
+
+        new_classes = {}
+        for new_class in range(len(merged)):
+            for j in merged[new_class][2]:
+                new_classes[j] = new_class
+        symbol_classes = SymbolClassMap(
+            (code, last, new_classes[j])
+            for code, last, j in self.symbol_classes.intervals()
+            if j in new_classes)
+
+        #number the blocks in breadth-first order
+        start_block = block_of[self.start_state]
+        state_ids = {start_block: 0}
+        order = [start_block]
+        i = 0
+        while i < len(order):
+            for _, old_class, _ in merged:
+                x = block_target(order[i], old_class)
+                if x != dead_block and x not in state_ids:
+                    state_ids[x] = len(order)
+                    order.append(x)
+            i += 1
+
+        table = array('i')
+        for block in order:
+            for _, old_class, _ in merged:
+                x = block_target(block, old_class)
+                table.append(state_ids[x] if x != dead_block else -1)
+
+        new_accepted = [representatives[x] in accepted for x in order]
+
+        return DFA(0, new_accepted, symbol_classes, table, self.unanchored)
+
+class LazyDFA:
+    """Implements a DFA which is constructed on demand from a NFA
+
+    Attributes
+    ----------
+    self.nfa : NFA
+
+    self.max_cache_size : int
+
+    self.start_state : frozenset (int)
+        epsilon closure of the start node of self.nfa
+
+    self.cache : dict ((frozenset (int), str), frozenset (int))
+        memoized transitions between sets of NFA states
+
+    self.hits, self.misses, self.evictions : int
+        cache statistics, see cache_info
+
+    self.lock : threading.Lock
+        guards self.cache and the statistics
+
+    Notes
+    -----
+    The states of the DFA are sets of NFA states as in NFA.to_dfa, but a
+    transition is computed only when the input reaches it. Computed
+    transitions are memoized in self.cache. When the cache is full, the oldest
+    transition is evicted, so the memory use stays bounded even if the full
+    DFA would be huge. Transitions that are not in the cache are computed by
+    simulating the NFA, so with max_cache_size == 0 this is plain NFA
+    simulation.
+
+    A LazyDFA can be shared by threads, e.g. through compile. The lock is
+    not held while a transition is computed, so if two threads compute the
+    same transition, the first one stored is kept.
+    """
+    def __init__(self, nfa, max_cache_size=1024):
+        if max_cache_size < 0:
+            raise ValueError("max_cache_size cannot be negative")
+
+        self.nfa = nfa
+        if not self.nfa.compiled:
+            self.nfa.compile()
+
+        self.max_cache_size = max_cache_size
+        self.start_state = frozenset(
+            nfa.reachable_with_empty([nfa.start_node]))
+        self.accepted_nodes = frozenset(nfa.accepted_nodes)
+
+        self.cache = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def step(self, state, symbol):
+        """Returns the state reached from state with symbol
+
+        Parameters
+        ----------
+        state : frozenset (int)
+
+        symbol : str
+
+        Returns
+        -------
+        new_state : frozenset (int)
+        """
+        key = (state, symbol)
+        with self.lock:
+            new_state = self.cache.get(key)
+            if new_state is not None:
+                self.hits += 1
+                return new_state
+            self.misses += 1
+
+        new_node_list = self.nfa.reachable_with_symbol(list(state), symbol)
+        new_state = frozenset(self.nfa.reachable_with_empty(new_node_list))
+
+        if self.max_cache_size == 0:
+            return new_state
+
+        with self.lock:
+            if key in self.cache:
+                return self.cache[key]
+            if len(self.cache) >= self.max_cache_size:
+                #dicts preserve insertion order so the first key is the oldest
+                del self.cache[next(iter(self.cache))]
+                self.evictions += 1
+            self.cache[key] = new_state
+
+        return new_state
+
+    def evaluate(self, s):
+        """Determine if the DFA accepts string s
+        """
+        state = self.start_state
+        for symbol in s:
+            state = self.step(state, symbol)
+            if not state:
+                return False
+
+        return not self.accepted_nodes.isdisjoint(state)
+
+    def cache_info(self):
+        """Report cache statistics
+
+        Returns
+        -------
+        info : CacheInfo
+        """
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.evictions,
+                             self.max_cache_size, len(self.cache))
+
+    def cache_clear(self):
+        """Clear the cache and statistics
+        """
+        with self.lock:
+            self.cache.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
 class ParseTreeNode:
     """Used to represent the regex as a tree
 
@@ -555,9 +2164,15 @@ class ParseTreeNode:
 
         only in the inner nodes of the final tree
 
+    self.groups : list (int)
+        indexes of the capture groups, i.e. pairs of parentheses, whose
+        contents the node is. Groups are numbered from 1 in the order of
+        their opening parentheses.
+
     Also used during the parsing process when the regex is represented
     """
-    def __init__(self, children=[], meta=None, normal=None, operation=None):
+    def __init__(self, children=[], meta=None, normal=None, operation=None,
+                 groups=None):
         self.children = children
         #meta and normal are used for leaves
         self.meta = meta
@@ -569,12 +2184,15 @@ class ParseTreeNode:
         #operation is used for internal nodes in the final tree
         self.operation = operation
 
+        self.groups = [] if groups is None else groups
+
     def __eq__(self, other):
         if not isinstance(other, ParseTreeNode):
             return NotImplemented
 
         if self.meta != other.meta or self.normal != other.normal \
-           or self.operation != other.operation:
+           or self.operation != other.operation \
+           or self.groups != other.groups:
             return False
 
         if len(self.children) != len(other.children):
@@ -622,7 +2240,7 @@ class ParseTreeNode:
         prefix += 'N' if self.meta is None else self.meta[0]
         if self.normal is None:
             prefix += 'N'
-        elif self.normal is '':
+        elif self.normal == '':
             prefix += '_'
         else:
             prefix += self.normal[0]
@@ -665,11 +2283,101 @@ def parse_regex(regex):
     root : ParseTreeNode
         Root of the generated parse tree corresponding to regex
 
+    Notes
+    -----
+    A single left-to-right pass with an explicit stack of the enclosing
+    parentheses, so there is no recursion and the time is linear in
+    len(regex). Only the nodes of the final tree are allocated.
+
+    Gives the same tree as parse_nodes_to_tree(regex_to_parse_tree_nodes(
+    regex)): unary operators bind tightest, then concatenation and then
+    '|', and concatenations and unions are nested to the left.
+
+    The current sequence is kept as the concatenation of the finished
+    items and the last item, to which a following unary operator applies.
+    The alternatives before the last '|' are kept as one union node.
     """
+    #state of the enclosing parentheses:
+    #(union, concatenation, last, after_bar, group index)
+    stack = []
+    #union of the alternatives before the last '|' or None if there is none
+    union = None
+    #concatenation of the items of the current alternative before last
+    concatenation = None
+    #last item of the current alternative
+    last = None
+    #True if '|' was the previous symbol
+    after_bar = False
+    n_groups = 0
+
+    def finish(union, concatenation, last):
+        if last is None:
+            alternative = ParseTreeNode(normal='')
+        elif concatenation is None:
+            alternative = last
+        else:
+            alternative = ParseTreeNode(children=[concatenation, last],
+                                        operation='concatenation')
+        if union is None:
+            return alternative
+        return ParseTreeNode(children=[union, alternative], operation='|')
 
-    tmp = regex_to_parse_tree_nodes(regex)
-    root = parse_nodes_to_tree(tmp)
-    return root
+    i = 0
+    while i < len(regex):
+        symbol = regex[i]
+        i += 1
+
+        if symbol in '*+?':
+            if last is None:
+                if after_bar:
+                    raise ValueError("| cannot be followed by */+/?")
+                raise ValueError("Nothing to repeat in front of */+/?")
+            last = ParseTreeNode(children=[last], operation=symbol)
+            continue
+
+        if symbol == '|':
+            union = finish(union, concatenation, last)
+            concatenation = None
+            last = None
+            after_bar = True
+            continue
+
+        if symbol == '(':
+            n_groups += 1
+            stack.append((union, concatenation, last, after_bar, n_groups))
+            union = None
+            concatenation = None
+            last = None
+            after_bar = False
+            continue
+
+        if symbol == ')':
+            if len(stack) == 0:
+                raise ValueError("Incorrect parentheses in regex")
+            item = finish(union, concatenation, last)
+            union, concatenation, last, after_bar, group = stack.pop()
+            item.groups.append(group)
+        elif symbol == '\\':
+            item = ParseTreeNode(normal=regex[i:i+1])
+            i += 1
+        elif symbol == '.':
+            item = ParseTreeNode(meta='.')
+        else:
+            item = ParseTreeNode(normal=symbol)
+
+        if last is not None:
+            if concatenation is None:
+                concatenation = last
+            else:
+                concatenation = ParseTreeNode(children=[concatenation, last],
+                                              operation='concatenation')
+        last = item
+        after_bar = False
+
+    if len(stack) != 0:
+        raise ValueError("Incorrect parentheses in regex")
+
+    return finish(union, concatenation, last)
 
 def regex_to_parse_tree_nodes(regex):
     """Processes a regex string for further use
@@ -732,22 +2440,32 @@ def parse_nodes_to_tree(parse_nodes):
     #regex_lists[i] corresponds to a substring  which is enclosed in
     #i (unprocessed) parentheses
     regex_lists = [[]]
+    #group_indexes[i] is the capture group of regex_lists[i+1]
+    group_indexes = []
+    n_groups = 0
 
-    for i in range(len(regex_object_list)):
-        if regex_object_list[i].meta == '(':
+    for i in range(len(parse_nodes)):
+        if parse_nodes[i].meta == '(':
             regex_lists.append([])
+            n_groups += 1
+            group_indexes.append(n_groups)
 
-        elif regex_object_list[i].meta == ')':
-            if len(regex_list) <= 1:
-                raise ValueError("Incorrect parentheses in regex_object_list")
+        elif parse_nodes[i].meta == ')':
+            if len(regex_lists) <= 1:
+                raise ValueError("Incorrect parentheses in parse_nodes")
 
             tmp = parse_wo_parentheses(regex_lists[-1])
+            tmp.groups.append(group_indexes.pop())
             regex_lists[-2].append(tmp)
             regex_lists.pop()
         else:
-            regex_lists[-1].append(regex_object_list[i])
+            regex_lists[-1].append(parse_nodes[i])
+
+    if len(regex_lists) != 1:
+        raise ValueError("Incorrect parentheses in parse_nodes")
 
     root = parse_wo_parentheses(regex_lists[0])
+    return root
 
 def parse_wo_parentheses(parse_nodes):
     """Parses a ParseTreeNode list not containing any parentheses
@@ -764,7 +2482,11 @@ def parse_wo_parentheses(parse_nodes):
 
     """
 
-    regex_object_list = process_unary(regex_object_list)
+    #empty regex or empty parentheses match the empty string
+    if len(parse_nodes) == 0:
+        return ParseTreeNode(normal='')
+
+    regex_object_list = process_unary(parse_nodes)
     regex_object_list = process_concatenation(regex_object_list)
     regex_object_list = process_union(regex_object_list)
 
@@ -850,5 +2572,2225 @@ def process_union(parse_nodes):
 
     return result
 
+def postorder(root):
+    """Returns the nodes of a parse tree in post-order
+
+    Parameters
+    ----------
+    root : ParseTreeNode
+
+    Returns
+    -------
+    nodes : list (ParseTreeNode)
+        every node is after its children
+
+    Notes
+    -----
+    Iterative, so the depth of the tree is not limited by the recursion
+    limit.
+    """
+    nodes = []
+    stack = [root]
+    while len(stack) > 0:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(node.children)
+
+    nodes.reverse()
+    return nodes
+
+def leaf_symbols(node):
+    """Returns the symbols matched by a leaf of a parse tree
+
+    Parameters
+    ----------
+    node : ParseTreeNode
+
+    Returns
+    -------
+    symbols : str
+        empty if the leaf matches the empty string
+    """
+    if node.meta == '.':
+        return ALPHABET
+    if node.normal is None:
+        raise ValueError("Unknown leaf " + repr(node))
+    return node.normal
+
+def leaf_label(node):
+    """Returns the transition label of a leaf of a parse tree
+
+    Parameters
+    ----------
+    node : ParseTreeNode
+
+    Returns
+    -------
+    label : str or RangeSet
+        '' for the empty string, the character if the leaf matches one
+        character and a RangeSet otherwise
+    """
+    if node.meta == '.':
+        return ALPHABET_RANGES
+    symbols = leaf_symbols(node)
+    if len(symbols) <= 1:
+        return symbols
+    return RangeSet.from_characters(symbols)
+
+#longest pattern handled by ShiftOr, so the state fits in a machine word
+SHIFT_OR_MAX_LENGTH = 64
+
+def shift_or_positions(root):
+    """Returns the symbols of every position of a fixed length parse tree
+
+    Parameters
+    ----------
+    root : ParseTreeNode
+
+    Returns
+    -------
+    positions : list (str) or None
+        positions[i] are the symbols matching the i:th symbol, None if root
+        is not a concatenation of 1 to SHIFT_OR_MAX_LENGTH parts matching
+        exactly one symbol (characters, '.' and unions of these)
+    """
+    #symbols[id(node)] = symbols matched by node if it matches exactly one
+    #symbol, '' for the empty string and None otherwise
+    symbols = {}
+    for node in postorder(root):
+        if len(node.children) == 0:
+            symbols[id(node)] = leaf_symbols(node)
+        elif node.operation == '|':
+            children = [symbols[id(x)] for x in node.children]
+            if all(x == '' for x in children):
+                symbols[id(node)] = ''
+            elif None in children or '' in children:
+                symbols[id(node)] = None
+            else:
+                symbols[id(node)] = ''.join(sorted(set(''.join(children))))
+        else:
+            symbols[id(node)] = None
+
+    positions = []
+    stack = [root]
+    while len(stack) > 0:
+        node = stack.pop()
+        if node.operation == 'concatenation':
+            stack.extend(reversed(node.children))
+        elif symbols[id(node)] is None:
+            return None
+        elif symbols[id(node)] != '':
+            positions.append(symbols[id(node)])
+
+    if len(positions) == 0 or len(positions) > SHIFT_OR_MAX_LENGTH:
+        return None
+
+    return positions
+
+def literal_alternatives(root):
+    """Returns the strings of a parse tree of alternative literal strings
+
+    Parameters
+    ----------
+    root : ParseTreeNode
+
+    Returns
+    -------
+    words : list (str) or None
+        the strings matched by root if root is a union (|) of literal
+        strings, otherwise None
+    """
+    if root.operation != '|':
+        return None
+
+    #exact[id(node)] = the only string matched by node or None
+    exact = {}
+    words = []
+    for node in postorder(root):
+        children = [exact[id(x)] for x in node.children]
+        if len(children) == 0:
+            symbols = leaf_symbols(node)
+            exact[id(node)] = symbols if len(symbols) <= 1 else None
+        elif node.operation == 'concatenation' and None not in children:
+            exact[id(node)] = ''.join(children)
+        else:
+            exact[id(node)] = None
+
+        if node.operation == '|':
+            #children of a union which are unions themselves are not words
+            for child, word in zip(node.children, children):
+                if child.operation != '|':
+                    if word is None:
+                        return None
+                    words.append(word)
+
+    return words
+
+def compile_program(root):
+    """Compile a parse tree into a program for PikeVM
+
+    Parameters
+    ----------
+    root : ParseTreeNode
+
+    Returns
+    -------
+    program : list (tuple)
+        instructions, where
+            ('char', label) : consume a symbol in label, see leaf_label
+            ('split', x, y) : continue from both x and y, x is preferred
+            ('jmp', x) : continue from x
+            ('save', slot) : store the current position in slot
+            ('match',) : the program matches
+
+    Notes
+    -----
+    Capture group g stores its start in slot 2*g and its end in slot
+    2*g+1. Group 0 is the whole match. Quantifiers are greedy, i.e. the
+    split instructions prefer repeating.
+
+    The tree is traversed with an explicit stack, so deep trees do not hit
+    the recursion limit. Jump targets are patched once the code they skip
+    has been emitted.
+    """
+    program = [['save', 0]]
+    stack = [('enter', root)]
+    while len(stack) > 0:
+        item = stack.pop()
+        action, node = item[0], item[1]
+
+        if action == 'enter':
+            for g in sorted(node.groups):
+                program.append(['save', 2*g])
+            stack.append(('close', node))
+
+            if len(node.children) == 0:
+                label = leaf_label(node)
+                if label != '':
+                    program.append(['char', label])
+            elif node.operation == 'concatenation':
+                for child in reversed(node.children):
+                    stack.append(('enter', child))
+            elif node.operation == '|':
+                stack.append(('union', node, 0, []))
+            elif node.operation in ['*', '?']:
+                split = ['split', len(program) + 1, None]
+                program.append(split)
+                stack.append((node.operation, node, split))
+                stack.append(('enter', node.children[0]))
+            elif node.operation == '+':
+                stack.append(('+', node, len(program)))
+                stack.append(('enter', node.children[0]))
+            else:
+                raise ValueError("Unknown operation " + repr(node.operation))
+
+        elif action == 'union':
+            i, jumps = item[2], item[3]
+            if i < len(node.children) - 1:
+                split = ['split', len(program) + 1, None]
+                program.append(split)
+                stack.append(('union_next', node, i, jumps, split))
+            else:
+                stack.append(('union_end', node, jumps))
+            stack.append(('enter', node.children[i]))
+
+        elif action == 'union_next':
+            i, jumps, split = item[2], item[3], item[4]
+            jump = ['jmp', None]
+            program.append(jump)
+            jumps.append(jump)
+            split[2] = len(program)
+            stack.append(('union', node, i + 1, jumps))
+
+        elif action == 'union_end':
+            for jump in item[2]:
+                jump[1] = len(program)
+
+        elif action == '*':
+            split = item[2]
+            program.append(['jmp', split[1] - 1])
+            split[2] = len(program)
+
+        elif action == '?':
+            item[2][2] = len(program)
+
+        elif action == '+':
+            program.append(['split', item[2], len(program) + 1])
+
+        elif action == 'close':
+            for g in sorted(node.groups, reverse=True):
+                program.append(['save', 2*g + 1])
+
+    program.append(['save', 1])
+    program.append(['match'])
+    return [tuple(x) for x in program]
+
+LiteralInfo = namedtuple('LiteralInfo', ['prefix', 'suffix', 'required'])
+
+#longest string kept by literal_info
+LITERAL_MAX_LENGTH = 256
+
+def common_prefix(strings):
+    """Returns the longest common prefix of a list of strings
+    """
+    if len(strings) == 0:
+        return ''
+    first = min(strings)
+    last = max(strings)
+    i = 0
+    while i < len(first) and first[i] == last[i]:
+        i += 1
+    return first[:i]
+
+def literal_info(root):
+    """Find literal strings that every string matched by a parse tree has
+
+    Parameters
+    ----------
+    root : ParseTreeNode
+
+    Returns
+    -------
+    info : LiteralInfo
+        info.prefix : every match starts with this string
+        info.suffix : every match ends with this string
+        info.required : every match contains this string. The longest such
+            string found.
+
+    Notes
+    -----
+    Computed bottom-up. In addition to the fields of LiteralInfo, a node
+    has an exact string if it matches only that string. For a
+    concatenation AB every match contains the suffix of A followed by the
+    prefix of B.
+
+    The strings are not necessarily the longest possible ones, e.g. for
+    (ab|cb) the suffix 'b' is found but nothing is found as required.
+
+    The strings are cut to at most LITERAL_MAX_LENGTH characters and an
+    exact string longer than that is dropped, so every node takes constant
+    time and memory. The entries of the children are removed when their
+    parent is processed.
+    """
+    max_length = LITERAL_MAX_LENGTH
+    #info[id(node)] = (exact, prefix, suffix, required) where exact is None
+    #if the node does not match exactly one string
+    info = {}
+
+    for node in postorder(root):
+        children = [info.pop(id(x)) for x in node.children]
+
+        if len(children) == 0:
+            symbols = leaf_symbols(node)
+            if len(symbols) <= 1:
+                info[id(node)] = (symbols, symbols, symbols, symbols)
+            else:
+                info[id(node)] = (None, '', '', '')
+
+        elif node.operation == 'concatenation':
+            exact, prefix, suffix, required = children[0]
+            for child in children[1:]:
+                junction = (suffix + child[1])[:max_length]
+                required = max([required, child[3], junction], key=len)
+                if exact is not None:
+                    prefix = (exact + child[1])[:max_length]
+                if child[0] is not None:
+                    suffix = (suffix + child[0])[-max_length:]
+                else:
+                    suffix = child[2]
+                if exact is not None and child[0] is not None \
+                   and len(exact) + len(child[0]) <= max_length:
+                    exact = exact + child[0]
+                else:
+                    exact = None
+            info[id(node)] = (exact, prefix, suffix, required)
+
+        elif node.operation == '|':
+            exacts = {x[0] for x in children}
+            if len(exacts) == 1 and None not in exacts:
+                info[id(node)] = children[0]
+            else:
+                prefix = common_prefix([x[1] for x in children])
+                suffix = common_prefix([x[2][::-1] for x in children])[::-1]
+                info[id(node)] = (None, prefix, suffix,
+                                  max([prefix, suffix], key=len))
+
+        elif node.operation in ['*', '?']:
+            if children[0][0] == '':
+                info[id(node)] = children[0]
+            else:
+                info[id(node)] = (None, '', '', '')
+
+        elif node.operation == '+':
+            exact, prefix, suffix, required = children[0]
+            if exact == '':
+                info[id(node)] = children[0]
+            else:
+                info[id(node)] = (None, prefix, suffix, required)
+
+        else:
+            raise ValueError("Unknown operation " + repr(node.operation))
+
+    exact, prefix, suffix, required = info[id(root)]
+    return LiteralInfo(prefix, suffix, required)
+
+def glushkov_nfa(root):
+    """Construct a position (Glushkov) automaton from a parse tree
+
+    Parameters
+    ----------
+    root : ParseTreeNode
+
+    Returns
+    -------
+    nfa : NFA
+        NFA without empty string transitions
+
+    Notes
+    -----
+    Every leaf matching a symbol is a position. The NFA has a start node 0
+    and node p+1 for position p. All transitions into node p+1 are labeled
+    with the symbols of position p, so no empty string transitions or extra
+    nodes are needed. The NFA is computed from the sets
+
+        nullable : does the subtree match the empty string
+        first : positions that can match the first symbol of the subtree
+        last : positions that can match the last symbol of the subtree
+        follow[p] : positions that can follow position p
+
+    """
+    #symbols[p] is the transition label of position p
+    symbols = []
+    follow = []
+    #info[id(node)] = (nullable, first, last)
+    info = {}
+
+    for node in postorder(root):
+        children = [info[id(x)] for x in node.children]
+
+        if len(children) == 0:
+            label = leaf_label(node)
+            if label == '':
+                info[id(node)] = (True, set(), set())
+            else:
+                symbols.append(label)
+                follow.append(set())
+                position = {len(symbols) - 1}
+                info[id(node)] = (False, position, position.copy())
+
+        elif node.operation == 'concatenation':
+            nullable, first, last = children[0]
+            first = first.copy()
+            last = last.copy()
+            for child_nullable, child_first, child_last in children[1:]:
+                for p in last:
+                    follow[p] |= child_first
+                if nullable:
+                    first |= child_first
+                if child_nullable:
+                    last |= child_last
+                else:
+                    last = child_last.copy()
+                nullable = nullable and child_nullable
+            info[id(node)] = (nullable, first, last)
+
+        elif node.operation == '|':
+            nullable = any(x[0] for x in children)
+            first = set().union(*[x[1] for x in children])
+            last = set().union(*[x[2] for x in children])
+            info[id(node)] = (nullable, first, last)
+
+        elif node.operation in ['*', '+', '?']:
+            nullable, first, last = children[0]
+            if node.operation in ['*', '+']:
+                for p in last:
+                    follow[p] |= first
+            if node.operation in ['*', '?']:
+                nullable = True
+            info[id(node)] = (nullable, first, last)
+
+        else:
+            raise ValueError("Unknown operation " + repr(node.operation))
+
+    nullable, first, last = info[id(root)]
+
+    transitions = []
+    for q in first:
+        transitions.append((0, q + 1, symbols[q]))
+    for p in range(len(follow)):
+        for q in follow[p]:
+            transitions.append((p + 1, q + 1, symbols[q]))
+
+    accepted_nodes = sorted([p + 1 for p in last])
+    if nullable:
+        accepted_nodes.insert(0, 0)
+
+    return NFA(len(symbols) + 1, 0, accepted_nodes, transitions)
+
+def thompson_nfa(root):
+    """Construct a Thompson NFA from a parse tree with NFABuilder
+
+    Parameters
+    ----------
+    root : ParseTreeNode
+
+    Returns
+    -------
+    nfa : NFA
+        NFA with empty string transitions, built in time linear in the size
+        of the tree
+    """
+    builder = NFABuilder()
+    #fragments[id(node)] = fragment of the subtree of node
+    fragments = {}
+
+    for node in postorder(root):
+        children = [fragments.pop(id(x)) for x in node.children]
+
+        if len(children) == 0:
+            fragment = builder.symbols(leaf_label(node))
+        elif node.operation == 'concatenation':
+            fragment = children[0]
+            for child in children[1:]:
+                fragment = builder.concatenate(fragment, child)
+        elif node.operation == '|':
+            fragment = children[0]
+            for child in children[1:]:
+                fragment = builder.union(fragment, child)
+        elif node.operation == '*':
+            fragment = builder.star(children[0])
+        elif node.operation == '+':
+            fragment = builder.plus(children[0])
+        elif node.operation == '?':
+            fragment = builder.question(children[0])
+        else:
+            raise ValueError("Unknown operation " + repr(node.operation))
+
+        fragments[id(node)] = fragment
+
+    return builder.build(fragments[id(root)])
+
+class RegexSet:
+    """Matches a string against many regexes in a single pass
+
+    Attributes
+    ----------
+    self.patterns : list (str)
+
+    self.nfa : NFA
+        union of the position automata of the patterns
+
+    self.accept_masks : list (int)
+        self.accept_masks[i] is the bitset of the accepted nodes of
+        self.patterns[i] in self.nfa
+
+    Notes
+    -----
+    The position automata of the patterns (see glushkov_nfa) are placed
+    into one NFA with a new start node having an empty string transition to
+    the start of every pattern. The NFA is simulated with the bit-parallel
+    engine, so the cost depends on the length of the input and the number
+    of active nodes, not on the number of patterns. Accepted nodes are
+    tagged with the pattern ids using self.accept_masks.
+    """
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+
+        n_nodes = 1
+        transitions = []
+        accepted_nodes = []
+        self.accept_masks = []
+        for pattern in self.patterns:
+            nfa = glushkov_nfa(parse_regex(pattern))
+            nfa.apply_offset(n_nodes)
+            n_nodes = nfa.n_nodes
+
+            transitions.extend(nfa.transitions)
+            transitions.append((0, nfa.start_node, ''))
+            accepted_nodes.extend(nfa.accepted_nodes)
+
+            accept_mask = 0
+            for x in nfa.accepted_nodes:
+                accept_mask |= 1 << x
+            self.accept_masks.append(accept_mask)
+
+        self.nfa = NFA(n_nodes, 0, accepted_nodes, transitions)
+        self.nfa.compile()
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def matches(self, s):
+        """Return the indexes of the patterns matching the whole string s
+
+        Returns
+        -------
+        indexes : list (int)
+            in increasing order
+        """
+        mask = self.nfa.reachable_bitset(s)
+        return [i for i in range(len(self.accept_masks))
+                if mask & self.accept_masks[i]]
+
+    def is_match(self, s):
+        """Determine if any of the patterns matches the whole string s
+        """
+        return self.nfa.evaluate_bitset(s)
+
+class ShiftOr:
+    """Shift-Or (bitap) matcher for fixed length patterns
+
+    Attributes
+    ----------
+    self.length : int
+        length of every match
+
+    self.full_mask : int
+        self.length one bits
+
+    self.masks : dict (str, int)
+        bit i of self.masks[x] is 0 if symbol x matches position i. Symbols
+        not in the dict match no position.
+
+    Notes
+    -----
+    The state is an integer whose bit i is 0 if the last i+1 symbols match
+    the first i+1 positions. Reading a symbol x shifts the state left and
+    ORs it with self.masks[x], and a match ends where bit self.length-1
+    is 0.
+    """
+    def __init__(self, positions):
+        if len(positions) == 0:
+            raise ValueError("positions cannot be empty")
+
+        self.length = len(positions)
+        self.full_mask = (1 << self.length) - 1
+        self.masks = {}
+        for i in range(self.length):
+            for x in positions[i]:
+                self.masks[x] = self.masks.get(x, self.full_mask) & ~(1 << i)
+
+    def evaluate(self, s):
+        """Determine if the whole string s matches the pattern
+        """
+        if len(s) != self.length:
+            return False
+
+        for i in range(len(s)):
+            if self.masks.get(s[i], self.full_mask) >> i & 1:
+                return False
+
+        return True
+
+    def search(self, s, pos=0, max_mismatches=0):
+        """Find the leftmost match, allowing mismatching symbols
+
+        Parameters
+        ----------
+        s : str
+
+        pos : int
+            index where the search starts
+
+        max_mismatches : non-negative integer
+            number of positions which may match any symbol
+
+        Returns
+        -------
+        span : (int, int) or None
+            s[span[0]:span[1]] is the match, None if there is no match
+
+        Notes
+        -----
+        With mismatches, state[j] is the state allowing j mismatches. A
+        mismatch at the current symbol is allowed by shifting the previous
+        state[j-1] without ORing the mask.
+        """
+        if max_mismatches < 0:
+            raise ValueError("max_mismatches cannot be negative")
+
+        masks = self.masks
+        full_mask = self.full_mask
+        match_bit = 1 << (self.length - 1)
+
+        if max_mismatches == 0:
+            state = full_mask
+            for i in range(pos, len(s)):
+                state = ((state << 1) | masks.get(s[i], full_mask)) \
+                    & full_mask
+                if not state & match_bit:
+                    return (i + 1 - self.length, i + 1)
+            return None
+
+        states = [full_mask for j in range(max_mismatches + 1)]
+        for i in range(pos, len(s)):
+            mask = masks.get(s[i], full_mask)
+            previous = states[0]
+            states[0] = ((previous << 1) | mask) & full_mask
+            for j in range(1, max_mismatches + 1):
+                current = states[j]
+                states[j] = ((current << 1) | mask) & (previous << 1) \
+                    & full_mask
+                previous = current
+            if not states[max_mismatches] & match_bit:
+                return (i + 1 - self.length, i + 1)
+
+        return None
+
+    def finditer(self, s, pos=0, max_mismatches=0):
+        """Yield the spans of non-overlapping leftmost matches, see search
+        """
+        while True:
+            match = self.search(s, pos, max_mismatches)
+            if match is None:
+                return
+            yield match
+            pos = match[1]
+
+class AhoCorasick:
+    """Aho-Corasick automaton for finding a set of strings
+
+    Attributes
+    ----------
+    self.words : set (str)
+
+    self.max_length : int
+        length of the longest word
+
+    self.symbol_classes : dict (str, int)
+        column of each symbol of the words in self.goto
+
+    self.n_classes : int
+
+    self.goto : array ('i')
+        self.goto[i*self.n_classes + j] is the state reached from state i
+        with a symbol of class j. The failure transitions are already
+        followed, so this is a DFA.
+
+    self.fail : array ('i')
+        self.fail[i] is the state of the longest proper suffix of the string
+        of state i which is a prefix of a word
+
+    self.longest : array ('i')
+        self.longest[i] is the length of the longest word which is a suffix
+        of the string of state i, 0 if there is none
+
+    Notes
+    -----
+    The states are the prefixes of the words, state 0 is the empty prefix.
+    Symbols not in any word lead to state 0.
+    """
+    def __init__(self, words):
+        self.words = set(words)
+        self.max_length = max([len(x) for x in self.words], default=0)
+
+        symbols = sorted({x for word in self.words for x in word})
+        self.symbol_classes = {x: i for i, x in enumerate(symbols)}
+        self.n_classes = n_classes = len(symbols)
+
+        #trie with -1 for missing edges
+        goto = array('i', [-1] * n_classes)
+        longest = array('i', [0])
+        for word in sorted(self.words):
+            state = 0
+            for x in word:
+                i = state*n_classes + self.symbol_classes[x]
+                if goto[i] == -1:
+                    goto[i] = len(longest)
+                    goto.extend([-1] * n_classes)
+                    longest.append(0)
+                state = goto[i]
+            longest[state] = len(word)
+
+        #breadth-first order so the failure states are processed first
+        fail = array('i', [0] * len(longest))
+        queue = []
+        for j in range(n_classes):
+            if goto[j] == -1:
+                goto[j] = 0
+            else:
+                queue.append(goto[j])
+
+        i = 0
+        while i < len(queue):
+            state = queue[i]
+            longest[state] = max(longest[state], longest[fail[state]])
+            for j in range(n_classes):
+                target = goto[state*n_classes + j]
+                fail_target = goto[fail[state]*n_classes + j]
+                if target == -1:
+                    goto[state*n_classes + j] = fail_target
+                else:
+                    fail[target] = fail_target
+                    queue.append(target)
+            i += 1
+
+        self.goto = goto
+        self.fail = fail
+        self.longest = longest
+
+    def search(self, s, pos=0):
+        """Find the leftmost-longest occurrence of a word in s
+
+        Parameters
+        ----------
+        s : str
+
+        pos : int
+            index where the search starts
+
+        Returns
+        -------
+        span : (int, int) or None
+            s[span[0]:span[1]] is a word, None if there is no occurrence
+
+        Notes
+        -----
+        The longest word ending at a position gives the leftmost occurrence
+        ending there. After an occurrence starting at p is found, the scan
+        continues until p + self.max_length, since an occurrence starting at
+        p or before cannot end later.
+        """
+        symbol_classes = self.symbol_classes
+        n_classes = self.n_classes
+        goto = self.goto
+        longest = self.longest
+
+        match = (pos, pos) if '' in self.words else None
+        state = 0
+        for i in range(pos, len(s)):
+            if match is not None and i >= match[0] + self.max_length:
+                break
+
+            symbol_class = symbol_classes.get(s[i])
+            if symbol_class is None:
+                state = 0
+                continue
+            state = goto[state*n_classes + symbol_class]
+
+            if longest[state] > 0:
+                start = i + 1 - longest[state]
+                if match is None or start < match[0] \
+                   or (start == match[0] and i + 1 > match[1]):
+                    match = (start, i + 1)
+
+        return match
+
+    def finditer(self, s, pos=0):
+        """Yield the spans of non-overlapping leftmost-longest occurrences
+        """
+        while pos <= len(s):
+            match = self.search(s, pos)
+            if match is None:
+                return
+            yield match
+            #continue after an empty match from the next position
+            pos = match[1] if match[1] > match[0] else match[1] + 1
+
+class PikeVM:
+    """Matcher reporting the spans of capture groups
+
+    Attributes
+    ----------
+    self.n_groups : int
+        number of capture groups, not including the whole match
+
+    self.program : list (tuple)
+        see compile_program
+
+    Notes
+    -----
+    The program is simulated by running all threads in lock step over the
+    input. Every thread has its own capture slots. At most one thread per
+    instruction is kept at each position, the one with the highest
+    priority, so the running time is O(len(s) * len(self.program)) even on
+    inputs which make backtracking matchers exponential.
+
+    The priorities give the same submatches as a backtracking matcher
+    with greedy quantifiers (leftmost-first), so the whole match of search
+    can differ from the leftmost-longest match of NFA.search.
+    """
+    def __init__(self, root):
+        self.n_groups = 0
+        for node in postorder(root):
+            self.n_groups = max([self.n_groups] + node.groups)
+        self.program = compile_program(root)
+
+    def add_thread(self, threads, visited, pc, slots, i):
+        """Add the thread at pc and the threads it reaches without input
+
+        Parameters
+        ----------
+        threads : list ((int, list (int)))
+            threads waiting for a symbol or at a match, by priority
+
+        visited : set (int)
+            instructions already visited at position i
+
+        pc : int
+
+        slots : list (int)
+
+        i : int
+            current position in the input
+        """
+        program = self.program
+        stack = [(pc, slots)]
+        while len(stack) > 0:
+            pc, slots = stack.pop()
+            if pc in visited:
+                continue
+            visited.add(pc)
+
+            instruction = program[pc]
+            if instruction[0] == 'jmp':
+                stack.append((instruction[1], slots))
+            elif instruction[0] == 'split':
+                #the preferred branch is handled first
+                stack.append((instruction[2], slots))
+                stack.append((instruction[1], slots))
+            elif instruction[0] == 'save':
+                slots = slots.copy()
+                slots[instruction[1]] = i
+                stack.append((pc + 1, slots))
+            else:
+                threads.append((pc, slots))
+
+    def run(self, s, pos, full):
+        """Returns the slots of the best match, see search and fullmatch
+        """
+        program = self.program
+        initial_slots = [-1 for i in range(2*self.n_groups + 2)]
+
+        threads = []
+        visited = set()
+        match = None
+        for i in range(pos, len(s) + 1):
+            if match is None and (not full or i == pos):
+                self.add_thread(threads, visited, 0, initial_slots, i)
+            if len(threads) == 0:
+                break
+
+            new_threads = []
+            new_visited = set()
+            for pc, slots in threads:
+                instruction = program[pc]
+                if instruction[0] == 'match':
+                    if full and i != len(s):
+                        continue
+                    #the remaining threads have lower priority
+                    match = slots
+                    break
+                if i < len(s) and s[i] in instruction[1]:
+                    self.add_thread(new_threads, new_visited, pc + 1, slots,
+                                    i + 1)
+
+            threads = new_threads
+            visited = new_visited
+
+        return match
+
+    def spans(self, slots):
+        if slots is None:
+            return None
+        return [None if slots[2*g] < 0 else (slots[2*g], slots[2*g + 1])
+                for g in range(self.n_groups + 1)]
+
+    def fullmatch(self, s):
+        """Match the whole string s and report the capture groups
+
+        Returns
+        -------
+        spans : list ((int, int) or None) or None
+            spans[g] is the span of the last match of group g or None if the
+            group did not participate, spans[0] is the whole match. None if
+            s does not match.
+        """
+        return self.spans(self.run(s, 0, True))
+
+    def search(self, s, pos=0):
+        """Find the leftmost match and report the capture groups
+
+        Parameters
+        ----------
+        s : str
+
+        pos : int
+            index where the search starts
+
+        Returns
+        -------
+        spans : list ((int, int) or None) or None
+            see fullmatch
+        """
+        return self.spans(self.run(s, pos, False))
+
+class OnePassDFA:
+    """DFA reporting capture groups for one-pass patterns
+
+    Attributes
+    ----------
+    self.n_groups : int
+
+    self.symbol_classes : dict (str, int)
+
+    self.n_classes : int
+
+    self.next_states : array ('i')
+        self.next_states[i*self.n_classes + j] is the state reached from
+        state i with a symbol of class j or -1
+
+    self.actions : list (tuple (int))
+        self.actions[i*self.n_classes + j] are the capture slots set to the
+        current position on the transition
+
+    self.match_actions : list (tuple (int) or None)
+        slots set at the end of the input in each state, None if the state
+        is not accepted
+
+    Notes
+    -----
+    A pattern is one-pass if at every position at most one thread of the
+    PikeVM can continue with the next symbol, so the capture slots can be
+    stored in the transitions. State 0 is the start and the other states
+    correspond to the char instructions of the program. See one_pass_dfa.
+    """
+    def __init__(self, n_groups, symbol_classes, next_states, actions,
+                 match_actions):
+        self.n_groups = n_groups
+        self.symbol_classes = symbol_classes
+        self.n_classes = len(set(symbol_classes.values()))
+        self.next_states = array('i', next_states)
+        self.actions = actions
+        self.match_actions = match_actions
+
+    def fullmatch(self, s):
+        """Match the whole string s and report the capture groups
+
+        Returns
+        -------
+        spans : list ((int, int) or None) or None
+            see PikeVM.fullmatch
+        """
+        symbol_classes = self.symbol_classes
+        n_classes = self.n_classes
+        next_states = self.next_states
+        actions = self.actions
+
+        slots = [-1 for i in range(2*self.n_groups + 2)]
+        state = 0
+        for i in range(len(s)):
+            symbol_class = symbol_classes.get(s[i])
+            if symbol_class is None:
+                return None
+            k = state*n_classes + symbol_class
+            if next_states[k] < 0:
+                return None
+            for slot in actions[k]:
+                slots[slot] = i
+            state = next_states[k]
+
+        if self.match_actions[state] is None:
+            return None
+        for slot in self.match_actions[state]:
+            slots[slot] = len(s)
+
+        return [None if slots[2*g] < 0 else (slots[2*g], slots[2*g + 1])
+                for g in range(self.n_groups + 1)]
+
+def dfa_finditer(forward_dfa, reverse_dfa, s, pos=0):
+    """Yield the spans of non-overlapping leftmost-longest matches
+
+    Parameters
+    ----------
+    forward_dfa : DFA
+        anchored DFA of the pattern
+
+    reverse_dfa : DFA
+        unanchored DFA of the reversed pattern, see NFA.reverse
+
+    s : str
+
+    pos : int
+        index where the search starts
+
+    Yields
+    ------
+    span : (int, int)
+
+    Notes
+    -----
+    One backward pass with reverse_dfa finds every position where a match
+    starts. The leftmost match starts at the first such position after the
+    previous match, and its end is found by a forward pass of forward_dfa
+    from there. Both passes are table lookups only, with no rescanning from
+    candidate start positions.
+    """
+    for start in reverse_dfa.reverse_scan(s, pos):
+        if start < pos:
+            continue
+        end = forward_dfa.longest_match(s, start)
+        yield (start, end)
+        #continue after an empty match from the next position
+        pos = end if end > start else end + 1
+
+def one_pass_dfa(program, n_groups):
+    """Construct a OnePassDFA from a PikeVM program if it is one-pass
+
+    Parameters
+    ----------
+    program : list (tuple)
+        see compile_program
+
+    n_groups : int
+
+    Returns
+    -------
+    dfa : OnePassDFA or None
+        None if the program is not one-pass
+
+    Notes
+    -----
+    For every state, all paths of jmp, split and save instructions are
+    followed from the state. The program is one-pass if
+        - no instruction is reached by two paths setting different slots
+        - no symbol is accepted by two char instructions reached
+    Then every symbol determines the next char instruction and the slots
+    set on the way.
+    """
+    char_pcs = [pc for pc in range(len(program)) if program[pc][0] == 'char']
+
+    #group the symbols by the char instructions accepting them
+    signatures = {}
+    for pc in char_pcs:
+        for x in program[pc][1]:
+            signatures.setdefault(x, []).append(pc)
+    classes = {}
+    symbol_classes = {}
+    for x in sorted(signatures):
+        signature = tuple(signatures[x])
+        symbol_classes[x] = classes.setdefault(signature, len(classes))
+    n_classes = len(classes)
+    class_symbols = [None for j in range(n_classes)]
+    for signature, j in classes.items():
+        class_symbols[j] = signature
+
+    state_ids = {0: 0}
+    entries = [0]
+    next_states = array('i')
+    actions = []
+    match_actions = []
+
+    i = 0
+    while i < len(entries):
+        #follow the paths from the instruction after the state
+        reached = {}
+        stack = [(entries[i] if i == 0 else entries[i] + 1, ())]
+        while len(stack) > 0:
+            pc, saves = stack.pop()
+            if pc in reached:
+                if reached[pc] != saves:
+                    return None
+                continue
+            reached[pc] = saves
+
+            instruction = program[pc]
+            if instruction[0] == 'jmp':
+                stack.append((instruction[1], saves))
+            elif instruction[0] == 'split':
+                stack.append((instruction[2], saves))
+                stack.append((instruction[1], saves))
+            elif instruction[0] == 'save':
+                stack.append((pc + 1, saves + (instruction[1],)))
+
+        targets = [None for j in range(n_classes)]
+        for pc, saves in reached.items():
+            if program[pc][0] != 'char':
+                continue
+            for j in range(n_classes):
+                if pc in class_symbols[j]:
+                    if targets[j] is not None:
+                        return None
+                    targets[j] = (pc, saves)
+
+        for j in range(n_classes):
+            if targets[j] is None:
+                next_states.append(-1)
+                actions.append(())
+                continue
+            pc, saves = targets[j]
+            if pc not in state_ids:
+                state_ids[pc] = len(entries)
+                entries.append(pc)
+            next_states.append(state_ids[pc])
+            actions.append(saves)
+
+        match_pcs = [pc for pc in reached if program[pc][0] == 'match']
+        match_actions.append(reached[match_pcs[0]] if match_pcs else None)
+        i += 1
+
+    return OnePassDFA(n_groups, symbol_classes, next_states, actions,
+                      match_actions)
+
+class Pattern:
+    """Compiled regular expression
+
+    Attributes
+    ----------
+    self.pattern : str
+
+    self.engine : str
+        'dfa', 'lazy_dfa', 'nodes' or 'bitset'
+
+    self.tree : ParseTreeNode
+        parse tree of self.pattern
+
+    self.nfa : NFA
+        position automaton of self.pattern, see glushkov_nfa
+
+    self.literals : LiteralInfo
+        literal strings used to speed up searching, see literal_info
+
+    self.aho_corasick : AhoCorasick or None
+        used instead of the automata if the pattern is an alternation of
+        literal strings, see literal_alternatives. Only with the default
+        engine 'dfa'.
+
+    self.shift_or : ShiftOr or None
+        used instead of the automata if the pattern is a short
+        concatenation of characters, unions and '.', see
+        shift_or_positions. Only with the default engine 'dfa'.
+
+    self.automaton : DFA, LazyDFA or NFA
+        automaton used by evaluate
+
+    self.search_dfa : DFA
+        unanchored DFA used by grep
+
+    Notes
+    -----
+    Use compile to reuse Pattern objects.
+
+    self.nfa and self.automaton are constructed only when they are needed.
+    The other engines than 'dfa' never use AhoCorasick or ShiftOr, so they
+    can be selected to compare the engines on any pattern.
+    If a DiskCache is set with set_disk_cache, the DFAs are loaded from it
+    instead of constructing them when possible.
+    """
+    ENGINES = ['dfa', 'lazy_dfa', 'nodes', 'bitset']
+
+    def __init__(self, pattern, engine='dfa'):
+        if engine not in Pattern.ENGINES:
+            raise ValueError("unknown engine " + repr(engine))
+
+        self.pattern = pattern
+        self.engine = engine
+        self.tree = parse_regex(pattern)
+        self.literals = literal_info(self.tree)
+
+        words = None
+        if engine == 'dfa':
+            words = literal_alternatives(self.tree)
+        self.aho_corasick = None if words is None else AhoCorasick(words)
+
+        positions = None
+        if engine == 'dfa' and self.aho_corasick is None:
+            positions = shift_or_positions(self.tree)
+        self.shift_or = None if positions is None else ShiftOr(positions)
+
+        self._nfa = None
+        self._automaton = None
+        self._pike_vm = None
+        self._one_pass_dfa = None
+        self._reverse_dfa = None
+        self._search_dfa = None
+
+    @property
+    def nfa(self):
+        """Position automaton of the pattern, constructed when first needed
+        """
+        if self._nfa is None:
+            nfa = glushkov_nfa(self.tree)
+            nfa.compile()
+            self._nfa = nfa
+        return self._nfa
+
+    @property
+    def automaton(self):
+        """Automaton of self.engine, constructed when first needed
+        """
+        if self._automaton is None:
+            if self.engine == 'dfa':
+                self._automaton = self.cached_dfa(
+                    'dfa', lambda: self.nfa.to_dfa().minimize())
+            elif self.engine == 'lazy_dfa':
+                self._automaton = self.nfa.to_lazy_dfa()
+            else:
+                self._automaton = self.nfa
+        return self._automaton
+
+    @property
+    def reverse_dfa(self):
+        """Unanchored DFA of the reversed pattern, see dfa_finditer
+        """
+        if self._reverse_dfa is None:
+            self._reverse_dfa = self.cached_dfa(
+                'reverse', lambda: self.nfa.reverse().to_dfa(
+                    unanchored=True).minimize())
+        return self._reverse_dfa
+
+    @property
+    def search_dfa(self):
+        """Unanchored DFA of the pattern, see NFA.to_dfa
+        """
+        if self._search_dfa is None:
+            self._search_dfa = self.cached_dfa(
+                'search', lambda: self.nfa.to_dfa(unanchored=True).minimize())
+        return self._search_dfa
+
+    def cached_dfa(self, flags, build):
+        """Return a DFA of the pattern from the disk cache or build it
+
+        Parameters
+        ----------
+        flags : str
+            identifies the kind of the DFA, see DiskCache.get
+
+        build : callable
+            returns the DFA if it is not cached
+        """
+        if disk_cache is None:
+            return build()
+        return disk_cache.get(self.pattern, flags, build)
+
+    @property
+    def pike_vm(self):
+        """Matcher for capture groups, constructed when first needed
+        """
+        if self._pike_vm is None:
+            self._pike_vm = PikeVM(self.tree)
+        return self._pike_vm
+
+    @property
+    def one_pass_dfa(self):
+        """OnePassDFA of the pattern or None if it is not one-pass
+        """
+        if self._one_pass_dfa is None:
+            #False marks that the pattern is not one-pass
+            dfa = one_pass_dfa(self.pike_vm.program, self.pike_vm.n_groups)
+            self._one_pass_dfa = False if dfa is None else dfa
+        return self._one_pass_dfa or None
+
+    def __repr__(self):
+        return "regex.compile(" + repr(self.pattern) + ")"
+
+    def evaluate(self, s):
+        """Determine if the whole string s matches the pattern
+        """
+        if self.aho_corasick is not None:
+            return s in self.aho_corasick.words
+        if self.shift_or is not None:
+            return self.shift_or.evaluate(s)
+        if self.engine in ['nodes', 'bitset']:
+            return self.nfa.evaluate(s, engine=self.engine)
+        return self.automaton.evaluate(s)
+
+    def search(self, s, pos=0):
+        """Find the leftmost-longest match, see NFA.search
+        """
+        if self.aho_corasick is not None:
+            return self.aho_corasick.search(s, pos)
+        if self.shift_or is not None:
+            return self.shift_or.search(s, pos)
+        return self.nfa.search(s, pos, self.literals.prefix,
+                               self.literals.required)
+
+    def finditer(self, s, pos=0):
+        """Yield the spans of the matches, see NFA.finditer
+
+        Notes
+        -----
+        With the 'dfa' engine the matches are found with a forward and a
+        reverse DFA, see dfa_finditer.
+        """
+        if self.aho_corasick is not None:
+            return self.aho_corasick.finditer(s, pos)
+        if self.shift_or is not None:
+            return self.shift_or.finditer(s, pos)
+        if self.engine == 'dfa':
+            if self.literals.required \
+               and s.find(self.literals.required, pos) == -1:
+                return iter(())
+            return dfa_finditer(self.automaton, self.reverse_dfa, s, pos)
+        return self.nfa.finditer(s, pos, self.literals.prefix,
+                                 self.literals.required)
+
+    def findall(self, s, pos=0):
+        """Return the matching substrings, see NFA.findall
+        """
+        return [s[start:end] for start, end in self.finditer(s, pos)]
+
+    def fullmatch_groups(self, s):
+        """Match the whole string and report the capture groups
+
+        Returns
+        -------
+        spans : list ((int, int) or None) or None
+            see PikeVM.fullmatch
+
+        Notes
+        -----
+        Uses the OnePassDFA if the pattern is one-pass.
+        """
+        if self.one_pass_dfa is not None:
+            return self.one_pass_dfa.fullmatch(s)
+        return self.pike_vm.fullmatch(s)
+
+    def search_groups(self, s, pos=0):
+        """Find the leftmost-first match and report the capture groups
+
+        Returns
+        -------
+        spans : list ((int, int) or None) or None
+            see PikeVM.search
+        """
+        return self.pike_vm.search(s, pos)
+
+class Matcher:
+    """Matches a string given in chunks
+
+    Attributes
+    ----------
+    self.automaton : DFA, LazyDFA or NFA
+
+    self.state : int or frozenset (int)
+        the current DFA state (-1 if no state can be reached), the current
+        LazyDFA state or the active NFA nodes as a bitset
+
+    self.finished : bool
+
+    Notes
+    -----
+    Only the current state is kept between the chunks, so the memory use
+    does not depend on the length of the input. The chunks are not
+    concatenated or copied.
+
+    Usage
+    -----
+        matcher = Matcher(regex.compile('a(b|c)*'))
+        for chunk in chunks:
+            matcher.feed(chunk)
+        result = matcher.finish()
+    """
+    def __init__(self, automaton):
+        if isinstance(automaton, Pattern):
+            automaton = automaton.automaton
+
+        if not isinstance(automaton, (DFA, LazyDFA, NFA)):
+            raise TypeError("automaton must be a DFA, LazyDFA, NFA or Pattern")
+
+        self.automaton = automaton
+        if isinstance(automaton, NFA) and not automaton.compiled:
+            automaton.compile()
+
+        self.reset()
+
+    def reset(self):
+        """Start matching a new string
+        """
+        if isinstance(self.automaton, NFA):
+            self.state = list_to_bitset(
+                self.automaton.closure(self.automaton.start_node))
+        else:
+            self.state = self.automaton.start_state
+        self.finished = False
+
+    def feed(self, chunk):
+        """Process the next chunk of the string
+
+        Parameters
+        ----------
+        chunk : str
+        """
+        if self.finished:
+            raise ValueError("feed called after finish")
+
+        automaton = self.automaton
+        state = self.state
+
+        if isinstance(automaton, DFA):
+            symbol_classes = automaton.symbol_classes
+            byte_classes = automaton.byte_classes
+            n_classes = automaton.n_classes
+            table = automaton.table
+            for symbol in chunk:
+                if state < 0:
+                    break
+                code = ord(symbol)
+                if code < 256:
+                    symbol_class = byte_classes[code]
+                else:
+                    symbol_class = symbol_classes.get(symbol, -1)
+                if symbol_class < 0:
+                    state = automaton.start_state if automaton.unanchored \
+                        else -1
+                else:
+                    state = table[state*n_classes + symbol_class]
+
+        elif isinstance(automaton, LazyDFA):
+            for symbol in chunk:
+                if not state:
+                    break
+                state = automaton.step(state, symbol)
+
+        else:
+            state = automaton.reachable_bitset(chunk, state)
+
+        self.state = state
+
+    def is_accepting(self):
+        """Determine if the string fed so far is accepted
+        """
+        automaton = self.automaton
+        if isinstance(automaton, DFA):
+            return self.state >= 0 and automaton.accepted[self.state]
+        elif isinstance(automaton, LazyDFA):
+            return not automaton.accepted_nodes.isdisjoint(self.state)
+        else:
+            return self.state & automaton.accept_mask != 0
+
+    def finish(self):
+        """Stop matching and determine if the whole string is accepted
+
+        Returns
+        -------
+        result : bool
+        """
+        self.finished = True
+        return self.is_accepting()
+
+class PatternCache:
+    """Thread-safe LRU cache of compiled Pattern objects
+
+    Attributes
+    ----------
+    self.maxsize : int
+        maximum number of cached patterns
+
+    self.cache : OrderedDict ((str, str), Pattern)
+        least recently used pattern first, keyed by (pattern, engine)
+
+    self.lock : threading.Lock
+
+    self.hits, self.misses, self.evictions : int
+    """
+    def __init__(self, maxsize=512):
+        if maxsize < 0:
+            raise ValueError("maxsize cannot be negative")
+
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, pattern, engine='dfa'):
+        """Return a compiled pattern, compiling it if it is not cached
+
+        Parameters
+        ----------
+        pattern : str
+
+        engine : str
+            see Pattern
+
+        Returns
+        -------
+        compiled : Pattern
+
+        Notes
+        -----
+        The lock is not held while compiling, so a slow pattern does not
+        block the other threads. If two threads compile the same pattern,
+        the first one stored is kept.
+        """
+        key = (pattern, engine)
+        with self.lock:
+            compiled = self.cache.get(key)
+            if compiled is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        compiled = Pattern(pattern, engine)
+
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            if self.maxsize == 0:
+                return compiled
+
+            self.cache[key] = compiled
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+                self.evictions += 1
+
+        return compiled
+
+    def cache_info(self):
+        """Report cache statistics
+
+        Returns
+        -------
+        info : CacheInfo
+        """
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.evictions,
+                             self.maxsize, len(self.cache))
+
+    def cache_clear(self):
+        """Clear the cache and statistics
+        """
+        with self.lock:
+            self.cache.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+pattern_cache = PatternCache()
+
+class DiskCache:
+    """Persistent LRU cache of compiled DFAs in a directory
+
+    Attributes
+    ----------
+    self.directory : str
+
+    self.max_size : int
+        maximum total size of the entries in bytes
+
+    self.lock : threading.Lock
+
+    self.hits, self.misses, self.evictions : int
+        statistics of this process
+
+    Notes
+    -----
+    Every entry is a DFA saved with save_dfa in a file named by the SHA-256
+    hash of ENGINE_VERSION, DFA_FORMAT_VERSION, the flags and the pattern,
+    so entries of other versions are never loaded. The modification time
+    of an entry is updated when it is used, and the least recently used
+    entries are removed when the total size exceeds self.max_size.
+
+    Entries are written to a temporary file which is then renamed with
+    os.replace, so concurrent processes see either a complete entry or no
+    entry. Entries that cannot be loaded are treated as missing.
+    """
+    def __init__(self, directory, max_size=64 << 20):
+        if max_size < 0:
+            raise ValueError("max_size cannot be negative")
+
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, pattern, flags):
+        """Returns the path of the entry of pattern and flags
+        """
+        key = '\0'.join([str(ENGINE_VERSION), str(DFA_FORMAT_VERSION), flags,
+                         pattern])
+        name = hashlib.sha256(key.encode('utf-8', 'surrogatepass')).hexdigest()
+        return os.path.join(self.directory, name + '.dfa')
+
+    def get(self, pattern, flags, build):
+        """Return a cached DFA, building and storing it if it is not cached
+
+        Parameters
+        ----------
+        pattern : str
+
+        flags : str
+            identifies how the DFA was built from the pattern
+
+        build : callable
+            returns the DFA if it is not cached
+
+        Returns
+        -------
+        dfa : DFA
+        """
+        path = self.path(pattern, flags)
+        try:
+            dfa = load_dfa(path)
+        except (OSError, ValueError):
+            dfa = None
+
+        if dfa is not None:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            with self.lock:
+                self.hits += 1
+            return dfa
+
+        with self.lock:
+            self.misses += 1
+        dfa = build()
+        self.put(path, dfa)
+        return dfa
+
+    def put(self, path, dfa):
+        """Atomically write an entry and evict old entries if needed
+
+        Parameters
+        ----------
+        path : str
+            see self.path
+
+        dfa : DFA
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(dfa.to_bytes())
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        self.evict()
+
+    def entries(self):
+        """Returns (mtime, size, path) of every entry, oldest first
+        """
+        result = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.dfa'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            result.append((stat.st_mtime_ns, stat.st_size, path))
+
+        result.sort()
+        return result
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits
+        """
+        entries = self.entries()
+        total_size = sum(x[1] for x in entries)
+        for mtime, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+            with self.lock:
+                self.evictions += 1
+
+    def cache_info(self):
+        """Report cache statistics
+
+        Returns
+        -------
+        info : CacheInfo
+            maxsize and currsize are in bytes
+        """
+        currsize = sum(x[1] for x in self.entries())
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.evictions,
+                             self.max_size, currsize)
+
+    def cache_clear(self):
+        """Remove all entries and clear the statistics
+        """
+        for mtime, size, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+#DiskCache used by Pattern, None if disabled
+disk_cache = None
+
+def set_disk_cache(directory, max_size=64 << 20):
+    """Enable or disable the disk cache of compiled DFAs
+
+    Parameters
+    ----------
+    directory : str or None
+        cache directory, None disables the cache
+
+    max_size : int
+        see DiskCache
+    """
+    global disk_cache
+    disk_cache = None if directory is None else DiskCache(directory,
+                                                           max_size)
+
+def compile(pattern, engine='dfa'):
+    """Compile a regex into a Pattern object, using a cache
+
+    Parameters
+    ----------
+    pattern : str
+
+    engine : str
+        see Pattern
+
+    Returns
+    -------
+    compiled : Pattern
+    """
+    return pattern_cache.get(pattern, engine)
+
+def cache_info():
+    """Report statistics of the cache used by compile
+    """
+    return pattern_cache.cache_info()
+
+def purge():
+    """Clear the cache used by compile
+    """
+    pattern_cache.cache_clear()
+
+def save_dfa(dfa, path):
+    """Write the DFA to a file, see DFA.to_bytes
+
+    Parameters
+    ----------
+    dfa : DFA
+
+    path : str
+    """
+    with open(path, 'wb') as f:
+        f.write(dfa.to_bytes())
+
+#mappings of the files loaded with load_dfa, (path, device, inode, size) as
+#the key. A mapping is closed when no loaded DFA uses it.
+mapped_files = weakref.WeakValueDictionary()
+mapped_files_lock = threading.Lock()
+
+def map_file(path):
+    """Returns a read-only mmap of the file at path
+
+    Notes
+    -----
+    mmap keeps a duplicate of the file descriptor open as long as the
+    mapping exists. Where possible (Python 3.13+) it is not kept, and
+    otherwise loading the same file again reuses the existing mapping, so
+    repeated loads do not open new descriptors. The mapping is shared, so
+    it sees writes to the file, and a file replaced with os.replace has a
+    new inode and is mapped again.
+    """
+    with open(path, 'rb') as f:
+        status = os.fstat(f.fileno())
+        key = (path, status.st_dev, status.st_ino, status.st_size)
+        with mapped_files_lock:
+            data = mapped_files.get(key)
+            if data is None:
+                if sys.version_info >= (3, 13):
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ,
+                                     trackfd=False)
+                else:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                mapped_files[key] = data
+
+    return data
+
+def load_dfa(path):
+    """Load a DFA written by save_dfa
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    dfa : DFA
+
+    Notes
+    -----
+    The file is memory-mapped read-only and the transition table is used
+    directly from the mapping, see DFA.from_buffer and map_file.
+    """
+    return DFA.from_buffer(map_file(path))
+
+def byte_class_table(dfa):
+    """Returns the symbol classes of the DFA for every byte value
+
+    Parameters
+    ----------
+    dfa : DFA
+
+    Returns
+    -------
+    classes : list (int)
+        classes[b] is the class of chr(b) or -1 if it has no class
+
+    Notes
+    -----
+    Bytes are treated as Latin-1 characters, so patterns containing only
+    ASCII characters match UTF-8 encoded text as expected.
+    """
+    return list(dfa.byte_classes)
+
+def grep_buffer(dfa, data, start=0, end=None, literal=b''):
+    """Yield the lines of data containing a match
+
+    Parameters
+    ----------
+    dfa : DFA
+        unanchored DFA, see NFA.to_dfa
+
+    data : bytes, mmap or other buffer supporting indexing and find
+
+    start, end : int
+        range of data to scan, start should be at the start of a line
+
+    literal : bytes
+        a string every match contains, see literal_info
+
+    Yields
+    ------
+    line : (int, int)
+        data[line[0]:line[1]] is a matching line without the newline
+
+    Notes
+    -----
+    The data is scanned byte by byte without decoding or copying it. The
+    DFA is reset to the start state at every newline.
+
+    If literal is given, bytes.find is used to skip to the lines
+    containing it and only those lines are scanned with the DFA.
+    """
+    if end is None:
+        end = len(data)
+
+    classes = byte_class_table(dfa)
+
+    if len(literal) == 0 or b'\n' in literal:
+        yield from grep_lines(dfa, classes, data, start, end)
+        return
+
+    line_start = start
+    while line_start < end:
+        i = data.find(literal, line_start, end)
+        if i == -1:
+            return
+        previous_newline = data.rfind(b'\n', line_start, i)
+        if previous_newline != -1:
+            line_start = previous_newline + 1
+        line_end = data.find(b'\n', i, end)
+        if line_end == -1:
+            line_end = end
+
+        yield from grep_lines(dfa, classes, data, line_start, line_end)
+        line_start = line_end + 1
+
+def grep_lines(dfa, classes, data, start, end):
+    """Yield the lines of data containing a match, see grep_buffer
+
+    Parameters
+    ----------
+    classes : list (int)
+        see byte_class_table
+    """
+    n_classes = dfa.n_classes
+    table = dfa.table
+    accepted = dfa.accepted
+    start_state = dfa.start_state
+
+    i = start
+    line_start = start
+    state = start_state
+    while line_start < end:
+        if accepted[state]:
+            line_end = data.find(b'\n', i, end)
+            if line_end == -1:
+                line_end = end
+            yield (line_start, line_end)
+            i = line_end + 1
+            line_start = i
+            state = start_state
+            continue
+
+        if i >= end:
+            return
+
+        byte = data[i]
+        i += 1
+        if byte == 10:
+            line_start = i
+            state = start_state
+        elif classes[byte] < 0:
+            state = start_state
+        else:
+            state = table[state*n_classes + classes[byte]]
+
+def grep_file(dfa, path, literal=b''):
+    """Yield the matching lines of a file
+
+    Parameters
+    ----------
+    dfa : DFA
+        unanchored DFA, see NFA.to_dfa
+
+    path : str
+
+    literal : bytes
+        see grep_buffer
+
+    Yields
+    ------
+    (offset, line) : (int, bytes)
+        byte offset of the start of the line and the line without the
+        newline
+    """
+    with open(path, 'rb') as f:
+        #empty files cannot be memory mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for line_start, line_end in grep_buffer(dfa, data,
+                                                    literal=literal):
+                yield line_start, data[line_start:line_end]
+
+#default size of the byte ranges a large file is split into by grep_parallel
+GREP_CHUNK_SIZE = 1 << 24
+
+def split_file(path, chunk_size=GREP_CHUNK_SIZE):
+    """Split a file into byte ranges ending at newlines
+
+    Parameters
+    ----------
+    path : str
+
+    chunk_size : positive integer
+        approximate size of a range
+
+    Returns
+    -------
+    ranges : list ((int, int))
+        consecutive ranges (start, end) covering the whole file. Every range
+        except the last ends right after a newline.
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return []
+        if size <= chunk_size:
+            return [(0, size)]
+
+        ranges = []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            while start < size:
+                end = data.find(b'\n', start + chunk_size - 1)
+                end = size if end == -1 else end + 1
+                ranges.append((start, end))
+                start = end
+
+        return ranges
+
+#DFA and literal used by grep_range in the worker processes of
+#grep_parallel
+grep_worker_dfa = None
+grep_worker_literal = b''
+
+def init_grep_worker(dfa, literal=b''):
+    """Store the DFA sent to a worker process once, see grep_parallel
+    """
+    global grep_worker_dfa, grep_worker_literal
+    grep_worker_dfa = dfa
+    grep_worker_literal = literal
+
+def grep_range(path, start, end):
+    """Return the matching lines in a byte range of a file
+
+    Parameters
+    ----------
+    path : str
+
+    start, end : int
+        range to scan, see split_file
+
+    Returns
+    -------
+    lines : list ((int, bytes))
+        offsets and contents of the matching lines, see grep_file
+
+    Notes
+    -----
+    Uses the DFA and literal given to init_grep_worker.
+    """
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            lines = grep_buffer(grep_worker_dfa, data, start, end,
+                                grep_worker_literal)
+            return [(x, data[x:y]) for x, y in lines]
+
+def grep_parallel(dfa, paths, jobs=None, chunk_size=GREP_CHUNK_SIZE,
+                  literal=b''):
+    """Yield the matching lines of files using a pool of processes
+
+    Parameters
+    ----------
+    dfa : DFA
+        unanchored DFA, see NFA.to_dfa
+
+    paths : list (str)
+
+    jobs : int or None
+        number of worker processes, None for the number of CPUs
+
+    chunk_size : positive integer
+        files larger than this are split into several ranges, see split_file
+
+    literal : bytes
+        see grep_buffer
+
+    Yields
+    ------
+    (path, offset, line) : (str, int, bytes)
+        in the order of paths and offsets
+
+    Notes
+    -----
+    Small files are scanned whole and large files are split into ranges
+    ending at newlines, so every line is in exactly one range. The DFA is
+    pickled once per worker process when the pool starts, so the pattern is
+    not parsed again in the workers.
+
+    Raises OSError if a file cannot be read.
+    """
+    tasks = []
+    for path in paths:
+        for start, end in split_file(path, chunk_size):
+            tasks.append((path, start, end))
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=init_grep_worker,
+            initargs=(dfa, literal)) as executor:
+        results = executor.map(grep_range, [x[0] for x in tasks],
+                               [x[1] for x in tasks], [x[2] for x in tasks])
+        for task, lines in zip(tasks, results):
+            for offset, line in lines:
+                yield task[0], offset, line
+
+def main(argv):
+    """Print the lines of files matching a regex
+
+    Parameters
+    ----------
+    argv : list (str)
+        command line arguments without the program name
+
+    Returns
+    -------
+    status : int
+        0 if any line matched, 1 if no line matched, 2 on errors
+    """
+    parser = argparse.ArgumentParser(
+        prog='regex.py',
+        description="Print the lines of FILEs containing a match of PATTERN "
+                    "prefixed by the byte offset of the line.")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of worker processes, 0 for the number "
+                             "of CPUs")
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help="reuse compiled automata stored in DIR")
+    parser.add_argument('pattern', metavar='PATTERN')
+    parser.add_argument('files', metavar='FILE', nargs='+')
+    args = parser.parse_args(argv)
+
+    if args.jobs < 0:
+        parser.error("the number of jobs cannot be negative")
+
+    if args.cache_dir is not None:
+        try:
+            set_disk_cache(args.cache_dir)
+        except OSError as e:
+            sys.stderr.write("regex.py: " + str(e) + "\n")
+            return 2
+
+    try:
+        pattern = compile(args.pattern)
+    except ValueError as e:
+        sys.stderr.write("regex.py: " + str(e) + "\n")
+        return 2
+
+    dfa = pattern.search_dfa
+    try:
+        literal = pattern.literals.required.encode('latin-1')
+    except UnicodeEncodeError:
+        literal = b''
+
+    out = sys.stdout.buffer
+    matched = False
+    failed = False
+
+    def write(path, offset, line):
+        if len(args.files) > 1:
+            out.write(path.encode() + b':')
+        out.write(str(offset).encode() + b':' + line + b'\n')
+
+    if args.jobs == 1:
+        for path in args.files:
+            try:
+                for offset, line in grep_file(dfa, path, literal):
+                    write(path, offset, line)
+                    matched = True
+            except OSError as e:
+                sys.stderr.write("regex.py: " + str(e) + "\n")
+                failed = True
+    else:
+        readable = []
+        for path in args.files:
+            try:
+                with open(path, 'rb'):
+                    readable.append(path)
+            except OSError as e:
+                sys.stderr.write("regex.py: " + str(e) + "\n")
+                failed = True
+
+        try:
+            for path, offset, line in grep_parallel(dfa, readable,
+                                                    args.jobs or None,
+                                                    literal=literal):
+                write(path, offset, line)
+                matched = True
+        except OSError as e:
+            sys.stderr.write("regex.py: " + str(e) + "\n")
+            failed = True
+
+    out.flush()
+    if failed:
+        return 2
+    return 0 if matched else 1
+
 if __name__ == '__main__':
-    pass
+    sys.exit(main(sys.argv[1:]))
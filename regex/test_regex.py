@@ -1,4 +1,11 @@
 #!/usr/bin/env python
+import os
+import pickle
+import re
+import sys
+import tempfile
+import threading
+import tracemalloc
 import unittest
 import regex
 
@@ -277,5 +284,1148 @@ class TestRegexParsing(unittest.TestCase):
         b = [n2, n4, n5, n7]
         self.assertEqual(a, b)
 
+class TestParseRegex(unittest.TestCase):
+    def test_parse_regex(self):
+        a = regex.parse_regex('a(b|c)*')
+        n1 = regex.ParseTreeNode(normal='b')
+        n2 = regex.ParseTreeNode(normal='c')
+        n3 = regex.ParseTreeNode(children=[n1, n2], operation='|',
+                                 groups=[1])
+        n4 = regex.ParseTreeNode(children=[n3], operation='*')
+        n5 = regex.ParseTreeNode(normal='a')
+        b = regex.ParseTreeNode(children=[n5, n4], operation='concatenation')
+        self.assertEqual(a, b)
+
+        self.assertEqual(regex.parse_regex(''), regex.ParseTreeNode(normal=''))
+        self.assertEqual(regex.parse_regex('()'),
+                         regex.ParseTreeNode(normal='', groups=[1]))
+
+        a = regex.parse_regex('((a)(b))')
+        n1 = regex.ParseTreeNode(normal='a', groups=[2])
+        n2 = regex.ParseTreeNode(normal='b', groups=[3])
+        b = regex.ParseTreeNode(children=[n1, n2], operation='concatenation',
+                                groups=[1])
+        self.assertEqual(a, b)
+        self.assertEqual(regex.parse_regex('((a))').groups, [2, 1])
+
+        with self.assertRaises(ValueError):
+            regex.parse_regex('(a')
+        with self.assertRaises(ValueError):
+            regex.parse_regex('a)')
+
+    def test_same_as_pipeline(self):
+        patterns = ['', 'a', 'abc', 'a|b|c', '|a', 'a|', 'a||b', 'ab*c+d?',
+                    '(a)', '()', '((a))', '(a|)*b', 'a(b|c)*|(d.)+e',
+                    '\\*\\(a\\\\', 'a\\', '((ab)|(c|d)e)?f**',
+                    '.|.(.)|']
+        for pattern in patterns:
+            nodes = regex.regex_to_parse_tree_nodes(pattern)
+            self.assertEqual(regex.parse_regex(pattern),
+                             regex.parse_nodes_to_tree(nodes), pattern)
+
+        for pattern in ['*', 'a|*', '(+a)', '(a', 'a)', '(()', '())']:
+            with self.assertRaises(ValueError):
+                regex.parse_regex(pattern)
+            with self.assertRaises(ValueError):
+                nodes = regex.regex_to_parse_tree_nodes(pattern)
+                regex.parse_nodes_to_tree(nodes)
+
+    def test_deep_nesting(self):
+        #no recursion limit
+        depth = 20000
+        root = regex.parse_regex('(' * depth + 'a' + ')' * depth + 'b*')
+        self.assertEqual(root.operation, 'concatenation')
+        self.assertEqual(root.children[0].groups, list(range(depth, 0, -1)))
+        self.assertEqual(root.children[1].operation, '*')
+
+        root = regex.parse_regex('ab' * depth)
+        n_leaves = sum(1 for x in regex.postorder(root)
+                       if len(x.children) == 0)
+        self.assertEqual(n_leaves, 2 * depth)
+
+class TestRangeSet(unittest.TestCase):
+    def test_ranges(self):
+        range_set = regex.RangeSet([('d', 'f'), ('a', 'b'), ('c', 'c'),
+                                    ('x', 'z'), ('y', 'y')])
+        self.assertEqual(range_set.ranges(), [('a', 'f'), ('x', 'z')])
+        self.assertEqual(len(range_set), 9)
+        self.assertEqual(''.join(range_set), 'abcdefxyz')
+        self.assertEqual(range_set, regex.RangeSet.from_characters('zyxfedcba'))
+        self.assertEqual(hash(range_set),
+                         hash(regex.RangeSet.from_characters('abcdefxyz')))
+
+        with self.assertRaises(ValueError):
+            regex.RangeSet([('b', 'a')])
+
+    def test_contains(self):
+        range_set = regex.RangeSet([('b', 'd'), ('\u0100', '\uffff')])
+        for x in 'bcd\u0100\u20ac\uffff':
+            self.assertIn(x, range_set)
+        for x in ['a', 'e', '\xff', '\U00010000', '', 'bc']:
+            self.assertNotIn(x, range_set)
+
+    def test_alphabet(self):
+        self.assertEqual(len(regex.ALPHABET_RANGES.ranges()), 2)
+        self.assertEqual(''.join(regex.ALPHABET_RANGES),
+                         ''.join(sorted(regex.ALPHABET)))
+
+class TestNFA(unittest.TestCase):
+    def test_evaluate(self):
+        a = regex.NFA.union_of_characters(['a'])
+        b = regex.NFA.union_of_characters(['b'])
+
+        nfa = a.concatenate(b)
+        self.assertTrue(nfa.evaluate('ab'))
+        self.assertFalse(nfa.evaluate('a'))
+        self.assertFalse(nfa.evaluate('abb'))
+
+        nfa = a.star()
+        self.assertTrue(nfa.evaluate(''))
+        self.assertTrue(nfa.evaluate('aaa'))
+        self.assertFalse(nfa.evaluate('aab'))
+
+        nfa = a.union(b).star()
+        self.assertTrue(nfa.evaluate(''))
+        self.assertTrue(nfa.evaluate('abba'))
+        self.assertFalse(nfa.evaluate('abc'))
+
+    def test_evaluate_bitset(self):
+        a = regex.NFA.union_of_characters(['a'])
+        b = regex.NFA.union_of_characters(['b'])
+        c = regex.NFA.union_of_characters(['c', 'd'])
+
+        #(a|b)*c((a|b)*c)*
+        nfa = a.union(b).star().concatenate(c).plus()
+        self.assertGreater(nfa.n_nodes, 8)
+        for s in ['', 'c', 'abc', 'abcd', 'abcbbad', 'abcbba', 'x', 'cx']:
+            self.assertEqual(nfa.evaluate(s, engine='bitset'),
+                             nfa.evaluate(s, engine='nodes'))
+
+        self.assertTrue(nfa.evaluate('abcbbad', engine='bitset'))
+        self.assertFalse(nfa.evaluate('abcbba', engine='bitset'))
+
+        with self.assertRaises(ValueError):
+            nfa.evaluate('a', engine='unknown')
+
+    def test_lazy_bit_tables(self):
+        nfa = regex.glushkov_nfa(regex.parse_regex('ab' * 100))
+        nfa.compile()
+        self.assertIsNone(nfa.bit_tables)
+        self.assertTrue(nfa.to_dfa().evaluate('ab' * 100))
+        self.assertIsNone(nfa.bit_tables)
+
+        self.assertTrue(nfa.evaluate('ab' * 100, engine='bitset'))
+        self.assertFalse(nfa.evaluate('ab' * 99 + 'a', engine='bitset'))
+        #the entries only span the successors of the chunk
+        for tables in nfa.bit_tables.values():
+            for shift, low, table in tables:
+                self.assertGreaterEqual(low, shift)
+                self.assertLess(max(table).bit_length(), 9)
+
+    def test_range_transitions(self):
+        nfa = regex.NFA.union_of_characters(['a', 'b', 'c', ''])
+        self.assertEqual(len(nfa.transitions), 2)
+        wide = regex.NFA(2, 0, [1], [(0, 1, regex.RangeSet([('a', 'z'),
+                                                            ('\u0400',
+                                                             '\u04ff')]))])
+        nfa = nfa.concatenate(wide).star()
+        for s in ['', 'ab', 'x\u0416', 'a\u0416bz', 'a', 'ad\u0500', 'A']:
+            self.assertEqual(nfa.evaluate(s, engine='bitset'),
+                             nfa.evaluate(s, engine='nodes'), s)
+            self.assertEqual(nfa.to_dfa().evaluate(s),
+                             nfa.evaluate(s, engine='nodes'), s)
+        self.assertTrue(nfa.evaluate('a\u0416bz'))
+
+        symbol_classes, representatives = nfa.symbol_partition()
+        self.assertEqual(representatives, ['a', 'd'])
+        self.assertEqual(symbol_classes['c'], 0)
+        self.assertEqual(symbol_classes['z'], 1)
+        self.assertEqual(symbol_classes['\u0416'], 1)
+        self.assertNotIn('A', symbol_classes)
+
+    def test_successor_mask(self):
+        a = regex.NFA.union_of_characters(['a'])
+        b = regex.NFA.union_of_characters(['b'])
+        nfa = a.union(b).star().concatenate(a.plus())
+        nfa.compile()
+        for node_list in [[nfa.start_node], list(range(nfa.n_nodes))]:
+            for symbol in 'abc':
+                nodes = nfa.reachable_with_empty(
+                    nfa.reachable_with_symbol(node_list, symbol))
+                self.assertEqual(regex.bitset_to_list(
+                    nfa.successor_mask(node_list, symbol)), nodes)
+
+    def test_compact(self):
+        nfa = regex.NFA.union_of_characters(['a', 'b'])
+        nfa = nfa.concatenate(regex.NFA.union_of_characters(['a'])).star()
+        nfa.compile()
+        compact = nfa.compact
+        self.assertEqual(len(compact.offsets), nfa.n_nodes + 1)
+        self.assertEqual(len(compact.targets), len(nfa.transitions))
+        self.assertEqual(compact.labels[0], '')
+        self.assertIn('a', compact.symbol_ids)
+        self.assertEqual(len(compact.range_ids), 1)
+        self.assertFalse(hasattr(compact, '__dict__'))
+
+        self.assertEqual(compact.transitions_with_symbol(0, 'b'), [1])
+        self.assertEqual(compact.transitions_with_symbol(0, 'a'), [1])
+        self.assertEqual(compact.transitions_with_symbol(0, 'c'), [])
+
+        copy = pickle.loads(pickle.dumps(compact))
+        self.assertEqual(copy.targets, compact.targets)
+        self.assertEqual(copy.labels, compact.labels)
+        nfa = pickle.loads(pickle.dumps(nfa))
+        self.assertTrue(nfa.evaluate('aaba'))
+        self.assertFalse(nfa.evaluate('aab'))
+
+    def test_compact_footprint(self):
+        #the whole compiled NFA, not only the arrays of the CompactNFA
+        n = 10000
+        tracemalloc.start()
+        try:
+            nfa = regex.NFA(n, 0, [n - 1],
+                            [(i, i + 1, 'ab'[i % 2]) for i in range(n - 1)])
+            nfa.compile()
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertTrue(nfa.evaluate(('ab' * n)[:n - 1]))
+
+        #a dict of sets of targets for every node
+        node_size = sys.getsizeof({'a': {1}}) + sys.getsizeof({1})
+        self.assertLess(10 * size / n, node_size)
+
+    def test_compute_closures(self):
+        #0 -> 1 -> 2 -> 3 with empty edges, 3 -> 4 with 'a'
+        transitions = [(0, 1, ''), (1, 2, ''), (2, 3, ''), (3, 4, 'a'),
+                       (2, 0, '')]
+        nfa = regex.NFA(5, 0, [4], transitions)
+        nfa.compile()
+        self.assertEqual([list(nfa.closure(i)) for i in range(5)],
+                         [[0, 1, 2, 3], [0, 1, 2, 3], [0, 1, 2, 3], [3], [4]])
+        self.assertEqual(nfa.reachable_with_empty([3, 4]), [3, 4])
+        self.assertEqual(nfa.reachable_with_empty([1]), [0, 1, 2, 3])
+        self.assertTrue(nfa.evaluate('a'))
+
+        #nodes without empty string edges store only themselves
+        nfa = regex.glushkov_nfa(regex.parse_regex('ab' * 1000))
+        nfa.compile()
+        self.assertEqual(len(nfa.closure_nodes), nfa.n_nodes)
+        self.assertTrue(nfa.evaluate('ab' * 1000))
+
+class TestDFA(unittest.TestCase):
+    def test_to_dfa(self):
+        a = regex.NFA.union_of_characters(['a'])
+        b = regex.NFA.union_of_characters(['b'])
+        c = regex.NFA.union_of_characters(['c', 'd'])
+
+        #(a|b)*c
+        nfa = a.union(b).star().concatenate(c)
+        dfa = nfa.to_dfa()
+        #c and d have identical transitions
+        self.assertEqual(dfa.n_classes, 3)
+        self.assertEqual(dfa.symbol_classes['c'], dfa.symbol_classes['d'])
+        self.assertEqual(len(dfa.table), dfa.n_states * dfa.n_classes)
+
+        for s, result in [('c', True), ('abbad', True), ('', False),
+                          ('ab', False), ('cc', False), ('abx', False)]:
+            self.assertEqual(dfa.evaluate(s), result)
+            self.assertEqual(nfa.evaluate(s), result)
+
+        nfa = a.question()
+        dfa = nfa.to_dfa()
+        self.assertTrue(dfa.evaluate(''))
+        self.assertTrue(dfa.evaluate('a'))
+        self.assertFalse(dfa.evaluate('aa'))
+
+    def test_symbol_partition(self):
+        nfa = regex.glushkov_nfa(regex.parse_regex('ab|.'))
+        symbol_classes, representatives = nfa.symbol_partition()
+        self.assertEqual(symbol_classes['c'], symbol_classes['\n'])
+        self.assertNotEqual(symbol_classes['a'], symbol_classes['c'])
+        self.assertNotEqual(symbol_classes['b'], symbol_classes['c'])
+        self.assertEqual(len(representatives), 3)
+        self.assertEqual(len(nfa.to_dfa().table), 3 * nfa.to_dfa().n_states)
+        self.assertEqual([symbol_classes[x] for x in representatives],
+                         [0, 1, 2])
+
+    def test_byte_classes(self):
+        nfa = regex.NFA.union_of_characters(['a', '\xe9', '\u20ac'])
+        dfa = nfa.to_dfa()
+        self.assertEqual(dfa.byte_classes[ord('a')], 0)
+        self.assertEqual(dfa.byte_classes[0xe9], 0)
+        self.assertEqual(dfa.byte_classes[ord('b')], -1)
+        self.assertTrue(dfa.evaluate('\u20ac'))
+        self.assertFalse(dfa.evaluate('\u20ad'))
+        self.assertEqual(regex.byte_class_table(dfa), list(dfa.byte_classes))
+
+    def test_minimize(self):
+        def minimal_dfa(pattern):
+            nfa = regex.glushkov_nfa(regex.parse_regex(pattern))
+            return nfa.to_dfa().minimize()
+
+        dfa = minimal_dfa('(a|b)*abb')
+        self.assertEqual(dfa.n_states, 4)
+        self.assertTrue(dfa.evaluate('babb'))
+        self.assertFalse(dfa.evaluate('abba'))
+
+        self.assertEqual(minimal_dfa('(a|b)*'), minimal_dfa('(a*b*)*'))
+        self.assertEqual(minimal_dfa('ab|ac'), minimal_dfa('a(c|b)'))
+        self.assertEqual(minimal_dfa('aa*'), minimal_dfa('a+'))
+        self.assertEqual(hash(minimal_dfa('aa*')), hash(minimal_dfa('a+')))
+        self.assertNotEqual(minimal_dfa('a*'), minimal_dfa('a+'))
+
+        #b and c behave identically
+        dfa = minimal_dfa('a(c|b)')
+        self.assertEqual(dfa.n_classes, 2)
+        self.assertEqual(dfa.symbol_classes, {'a': 0, 'b': 1, 'c': 1})
+
+        #symbols without accepting continuations are dropped
+        dfa = regex.DFA(0, [False, True, False], {'a': 0, 'b': 1},
+                        [1, 2, -1, -1, 2, 2])
+        minimal = dfa.minimize()
+        self.assertEqual(minimal.symbol_classes, {'a': 0})
+        self.assertEqual(minimal.n_states, 2)
+
+    def test_minimize_long(self):
+        #(ab)^n a*: the states of a* and the final state merge, and the
+        #states of (ab)^n split one at a time from the end
+        n = 1000
+        nfa = regex.glushkov_nfa(regex.parse_regex('ab' * n + 'a*'))
+        dfa = nfa.to_dfa()
+        minimal = dfa.minimize()
+        self.assertEqual(dfa.n_states, 2 * n + 2)
+        self.assertEqual(minimal.n_states, 2 * n + 1)
+        self.assertTrue(minimal.evaluate('ab' * n + 'aaa'))
+        self.assertFalse(minimal.evaluate('ab' * (n - 1) + 'aaa'))
+        self.assertEqual(minimal, minimal.minimize())
+
+    def test_minimize_empty(self):
+        dfa = regex.DFA(0, [False, False], {'a': 0}, [1, -1])
+        minimal = dfa.minimize()
+        self.assertEqual(minimal.n_states, 1)
+        self.assertEqual(minimal.n_classes, 0)
+        self.assertFalse(minimal.evaluate(''))
+        self.assertFalse(minimal.evaluate('a'))
+
+    def test_table_size(self):
+        with self.assertRaises(ValueError):
+            regex.DFA(0, [True], {'a': 0, 'b': 1}, [0])
+
+class TestSerialize(unittest.TestCase):
+    def test_round_trip(self):
+        for pattern in ['', 'a', 'ab*c|d.', '(a|b)*abb']:
+            nfa = regex.compile(pattern).nfa
+            for dfa in [nfa.to_dfa().minimize(), nfa.to_dfa(unanchored=True)]:
+                loaded = regex.DFA.from_buffer(dfa.to_bytes())
+                self.assertEqual(loaded, dfa)
+                self.assertEqual(hash(loaded), hash(dfa))
+                self.assertIsInstance(loaded.table, memoryview)
+                for s in ['', 'a', 'ac', 'abbc', 'dx', 'aabb', 'x\u20acd.']:
+                    self.assertEqual(loaded.evaluate(s), dfa.evaluate(s))
+
+    def test_file(self):
+        dfa = regex.compile('a(b|c)*').automaton
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'pattern.dfa')
+            regex.save_dfa(dfa, path)
+            loaded = regex.load_dfa(path)
+            self.assertEqual(loaded, dfa)
+            self.assertTrue(loaded.evaluate('abcb'))
+            self.assertFalse(loaded.evaluate('abd'))
+
+            #loaded DFAs can be sent to worker processes
+            copy = pickle.loads(pickle.dumps(loaded))
+            self.assertEqual(copy, dfa)
+
+    def test_wide_ranges(self):
+        wide = regex.RangeSet([('\u0100', '\U0010ffff')])
+        nfa = regex.NFA(3, 0, [2], [(0, 1, 'a'), (1, 2, wide)])
+        dfa = nfa.to_dfa().minimize()
+        self.assertEqual(len(dfa.symbol_classes.starts), 4)
+        self.assertLess(len(dfa.to_bytes()), 200)
+        loaded = regex.DFA.from_buffer(dfa.to_bytes())
+        self.assertEqual(loaded, dfa)
+        for s in ['a\U0010ffff', 'a\u0100', 'a\xff', 'aa', '\u0100']:
+            self.assertEqual(loaded.evaluate(s), nfa.evaluate(s), s)
+            self.assertEqual(dfa.evaluate(s), nfa.evaluate(s), s)
+
+    @unittest.skipUnless(os.path.isdir('/proc/self/fd'), "needs /proc")
+    def test_file_descriptors(self):
+        dfa = regex.compile('a(b|c)*').automaton
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'pattern.dfa')
+            regex.save_dfa(dfa, path)
+            loaded = [regex.load_dfa(path)]
+            n_fds = len(os.listdir('/proc/self/fd'))
+            for i in range(50):
+                loaded.append(regex.load_dfa(path))
+            self.assertEqual(len(os.listdir('/proc/self/fd')), n_fds)
+            self.assertTrue(all(x == dfa for x in loaded))
+
+            #through the disk cache
+            cache = regex.DiskCache(directory)
+            cache.get('a(b|c)*', 'dfa', lambda: dfa)
+            loaded.append(cache.get('a(b|c)*', 'dfa', lambda: dfa))
+            n_fds = len(os.listdir('/proc/self/fd'))
+            for i in range(50):
+                loaded.append(cache.get('a(b|c)*', 'dfa', lambda: dfa))
+            self.assertEqual(len(os.listdir('/proc/self/fd')), n_fds)
+
+            #a replaced file is mapped again
+            regex.save_dfa(regex.compile('x').automaton, path + '.new')
+            os.replace(path + '.new', path)
+            self.assertTrue(regex.load_dfa(path).evaluate('x'))
+            self.assertTrue(loaded[0].evaluate('abc'))
+
+    def test_invalid(self):
+        data = regex.compile('ab').automaton.to_bytes()
+        with self.assertRaises(ValueError):
+            regex.DFA.from_buffer(b'XXXX' + data[4:])
+        with self.assertRaises(ValueError):
+            regex.DFA.from_buffer(data[:4] + b'\xff\xff' + data[6:])
+        with self.assertRaises(ValueError):
+            regex.DFA.from_buffer(data[:-4])
+        with self.assertRaises(ValueError):
+            regex.DFA.from_buffer(data[:10])
+
+class TestGlushkov(unittest.TestCase):
+    def test_glushkov_nfa(self):
+        cases = [
+            ('a', ['a'], ['', 'b', 'aa']),
+            ('', [''], ['a']),
+            ('ab|c', ['ab', 'c'], ['', 'a', 'abc']),
+            ('a(b|c)*d', ['ad', 'abd', 'acbcd'], ['a', 'abc', 'abdd']),
+            ('(a|)+b?', ['', 'a', 'aab', 'b'], ['bb', 'ba']),
+            ('(a*)*', ['', 'aaa'], ['b']),
+            ('a.c', ['abc', 'a.c', 'a c'], ['ac', 'abbc']),
+            ('\\**\\.', ['.', '**.'], ['*a']),
+        ]
+        for pattern, accepted, rejected in cases:
+            nfa = regex.glushkov_nfa(regex.parse_regex(pattern))
+            for x in nfa.transitions:
+                self.assertNotEqual(x[2], '')
+            for s in accepted:
+                self.assertTrue(nfa.evaluate(s), (pattern, s))
+            for s in rejected:
+                self.assertFalse(nfa.evaluate(s), (pattern, s))
+
+    def test_range_labels(self):
+        #one transition per pair of positions even for '.'
+        nfa = regex.glushkov_nfa(regex.parse_regex('.(ab|.)'))
+        self.assertEqual(len(nfa.transitions), 4)
+        self.assertIn(regex.ALPHABET_RANGES, [x[2] for x in nfa.transitions])
+
+    def test_n_nodes(self):
+        #one node per position and the start node
+        nfa = regex.glushkov_nfa(regex.parse_regex('(ab|c)*d?'))
+        self.assertEqual(nfa.n_nodes, 5)
+
+        a = regex.NFA.union_of_characters(['a'])
+        b = regex.NFA.union_of_characters(['b'])
+        c = regex.NFA.union_of_characters(['c'])
+        d = regex.NFA.union_of_characters(['d'])
+        thompson = a.concatenate(b).union(c).star().concatenate(d.question())
+        self.assertGreater(thompson.n_nodes, 2 * nfa.n_nodes)
+
+        for s in ['', 'ab', 'abcd', 'cc', 'd', 'abd', 'a', 'dd', 'bd']:
+            self.assertEqual(nfa.evaluate(s), thompson.evaluate(s))
+
+class TestNFABuilder(unittest.TestCase):
+    def test_operations(self):
+        builder = regex.NFABuilder()
+        a = builder.symbols('a')
+        b = builder.symbols('b')
+        c = builder.symbols(regex.RangeSet.from_characters('cd'))
+        #(a|b)*c+d?
+        fragment = builder.concatenate(builder.star(builder.union(a, b)),
+                                       builder.plus(c))
+        d = builder.add(regex.NFA.union_of_characters(['d']))
+        nfa = builder.build(builder.concatenate(fragment,
+                                                builder.question(d)))
+        for s in ['c', 'abcc', 'bcdd', 'ccdd', 'abcdd']:
+            self.assertTrue(nfa.evaluate(s), s)
+        for s in ['', 'ab', 'da', 'abcda', 'ba']:
+            self.assertFalse(nfa.evaluate(s), s)
+
+    def test_thompson_nfa(self):
+        patterns = ['a', '', 'ab|c', 'a(b|c)*d', '(a|)+b?', '(a*)*', 'a.c',
+                    '((ab)+|c?)*d']
+        strings = ['', 'a', 'ab', 'c', 'abd', 'acbcd', 'aab', 'b', 'aaa',
+                   'a c', 'abababd', 'ccd', 'abcd', 'd']
+        for pattern in patterns:
+            root = regex.parse_regex(pattern)
+            thompson = regex.thompson_nfa(root)
+            glushkov = regex.glushkov_nfa(root)
+            for s in strings:
+                self.assertEqual(thompson.evaluate(s), glushkov.evaluate(s),
+                                 (pattern, s))
+
+    def test_long_concatenation(self):
+        #linear construction, the transitions are never copied
+        builder = regex.NFABuilder()
+        fragment = builder.symbols('a')
+        for i in range(2000):
+            fragment = builder.concatenate(fragment, builder.symbols('b'))
+        nfa = builder.build(fragment)
+        self.assertEqual(nfa.n_nodes, 4002)
+        self.assertEqual(len(nfa.transitions), 4001)
+        self.assertTrue(nfa.evaluate('a' + 'b'*2000, engine='bitset'))
+        self.assertFalse(nfa.evaluate('a' + 'b'*1999, engine='bitset'))
+
+class TestLazyDFA(unittest.TestCase):
+    def test_evaluate(self):
+        a = regex.NFA.union_of_characters(['a'])
+        b = regex.NFA.union_of_characters(['b'])
+        c = regex.NFA.union_of_characters(['c', 'd'])
+
+        #(a|b)*c
+        nfa = a.union(b).star().concatenate(c)
+        lazy_dfa = nfa.to_lazy_dfa()
+        for s, result in [('c', True), ('abbad', True), ('', False),
+                          ('ab', False), ('cc', False), ('abx', False)]:
+            self.assertEqual(lazy_dfa.evaluate(s), result)
+
+    def test_cache_info(self):
+        a = regex.NFA.union_of_characters(['a'])
+        b = regex.NFA.union_of_characters(['b'])
+        nfa = a.union(b).star()
+
+        lazy_dfa = nfa.to_lazy_dfa()
+        self.assertTrue(lazy_dfa.evaluate('abab'))
+        info = lazy_dfa.cache_info()
+        self.assertEqual(info.misses, 3)
+        self.assertEqual(info.hits, 1)
+        self.assertEqual(info.evictions, 0)
+        self.assertEqual(info.currsize, 3)
+
+        lazy_dfa.cache_clear()
+        self.assertEqual(lazy_dfa.cache_info(),
+                         regex.CacheInfo(0, 0, 0, 1024, 0))
+
+        lazy_dfa = nfa.to_lazy_dfa(max_cache_size=1)
+        self.assertTrue(lazy_dfa.evaluate('abab'))
+        info = lazy_dfa.cache_info()
+        self.assertEqual(info.evictions, info.misses - 1)
+        self.assertEqual(info.currsize, 1)
+
+        lazy_dfa = nfa.to_lazy_dfa(max_cache_size=0)
+        self.assertTrue(lazy_dfa.evaluate('abab'))
+        self.assertFalse(lazy_dfa.evaluate('abc'))
+        self.assertEqual(lazy_dfa.cache_info().currsize, 0)
+
+        with self.assertRaises(ValueError):
+            nfa.to_lazy_dfa(max_cache_size=-1)
+
+    def test_threads(self):
+        #a small shared cache is evicted concurrently by every thread
+        pattern = regex.Pattern('(a|b)*a(a|b)(a|b)(a|b)', 'lazy_dfa')
+        lazy_dfa = regex.LazyDFA(pattern.nfa, max_cache_size=4)
+        strings = ['abab' * i + x for i in range(1, 6)
+                   for x in ['aaab', 'bbbb', 'abba', 'babb']]
+        expected = [pattern.nfa.evaluate(x) for x in strings]
+        errors = []
+
+        def worker():
+            try:
+                for i in range(30):
+                    results = [lazy_dfa.evaluate(x) for x in strings]
+                    if results != expected:
+                        errors.append(results)
+            except Exception as e:
+                errors.append(e)
+
+        #switch threads often to make races likely
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=worker) for i in range(8)]
+            for x in threads:
+                x.start()
+            for x in threads:
+                x.join()
+        finally:
+            sys.setswitchinterval(interval)
+
+        self.assertEqual(errors, [])
+        info = lazy_dfa.cache_info()
+        self.assertLessEqual(info.currsize, 4)
+        self.assertEqual(info.hits + info.misses,
+                         8 * 30 * sum(len(x) for x in strings))
+
+class TestRegexSet(unittest.TestCase):
+    def test_matches(self):
+        patterns = ['a+', 'ab*', 'b(a|b)*', '', 'x.z']
+        regex_set = regex.RegexSet(patterns)
+        self.assertEqual(len(regex_set), 5)
+        for s in ['', 'a', 'aa', 'ab', 'abb', 'ba', 'xyz', 'c']:
+            expected = [i for i in range(len(patterns))
+                        if regex.compile(patterns[i]).evaluate(s)]
+            self.assertEqual(regex_set.matches(s), expected, s)
+            self.assertEqual(regex_set.is_match(s), len(expected) > 0)
+
+        self.assertEqual(regex.RegexSet([]).matches('a'), [])
+
+class TestPattern(unittest.TestCase):
+    def test_evaluate(self):
+        for engine in regex.Pattern.ENGINES:
+            pattern = regex.Pattern('a(b|c)*d', engine)
+            self.assertTrue(pattern.evaluate('abcbd'), engine)
+            self.assertFalse(pattern.evaluate('abcb'), engine)
+
+        with self.assertRaises(ValueError):
+            regex.Pattern('a', 'unknown')
+
+class TestSearch(unittest.TestCase):
+    def test_search(self):
+        pattern = regex.compile('ab*')
+        self.assertEqual(pattern.search('xxabbbxab'), (2, 6))
+        self.assertEqual(pattern.search('xxabbbxab', 3), (7, 9))
+        self.assertEqual(pattern.search('xxbbb'), None)
+
+        #leftmost is preferred over longest
+        pattern = regex.compile('abcd|bcdef')
+        self.assertEqual(pattern.search('abcdef'), (0, 4))
+
+        #a match found first must not hide a match starting before it
+        pattern = regex.compile('abcd|b')
+        self.assertEqual(pattern.search('abcd'), (0, 4))
+        self.assertEqual(pattern.nfa.search('abcd'), (0, 4))
+
+        #longest match from the leftmost position
+        pattern = regex.compile('a|ab|abc')
+        self.assertEqual(pattern.search('xabcx'), (1, 4))
+
+        pattern = regex.compile('b*')
+        self.assertEqual(pattern.search('abb'), (0, 0))
+
+        #Thompson NFA with empty string transitions
+        a = regex.NFA.union_of_characters(['a'])
+        b = regex.NFA.union_of_characters(['b'])
+        nfa = a.union(b).star().concatenate(b)
+        self.assertEqual(nfa.search('xxabab'), (2, 6))
+        self.assertEqual(nfa.search('xxaaa'), None)
+
+    def test_finditer(self):
+        pattern = regex.compile('ab*')
+        self.assertEqual(list(pattern.finditer('abxabbaab')),
+                         [(0, 2), (3, 6), (6, 7), (7, 9)])
+        self.assertEqual(pattern.findall('abxabbaab'),
+                         ['ab', 'abb', 'a', 'ab'])
+        self.assertEqual(pattern.findall('abxabbaab', 4), ['a', 'ab'])
+
+        pattern = regex.compile('a*')
+        self.assertEqual(list(pattern.finditer('baa')),
+                         [(0, 0), (1, 3), (3, 3)])
+        self.assertEqual(pattern.findall(''), [''])
+
+class TestMatcher(unittest.TestCase):
+    def test_feed(self):
+        for engine in regex.Pattern.ENGINES:
+            pattern = regex.Pattern('a(bc)*d?', engine)
+            matcher = regex.Matcher(pattern)
+            self.assertFalse(matcher.is_accepting())
+            matcher.feed('ab')
+            self.assertFalse(matcher.is_accepting())
+            matcher.feed('')
+            matcher.feed('cb')
+            matcher.feed('c')
+            self.assertTrue(matcher.is_accepting())
+            self.assertTrue(matcher.finish())
+
+            with self.assertRaises(ValueError):
+                matcher.feed('d')
+
+            matcher.reset()
+            for chunk in ['a', 'bcd', 'x', 'd']:
+                matcher.feed(chunk)
+            self.assertFalse(matcher.finish())
+
+    def test_automata(self):
+        a = regex.NFA.union_of_characters(['a'])
+        b = regex.NFA.union_of_characters(['b'])
+        nfa = a.union(b).star().concatenate(b)
+        for automaton in [nfa, nfa.to_dfa(), nfa.to_lazy_dfa()]:
+            matcher = regex.Matcher(automaton)
+            matcher.feed('aba')
+            self.assertFalse(matcher.is_accepting())
+            matcher.feed('b')
+            self.assertTrue(matcher.finish())
+
+        with self.assertRaises(TypeError):
+            regex.Matcher('a')
+
+class TestGrep(unittest.TestCase):
+    def test_unanchored_dfa(self):
+        nfa = regex.compile('ab*c').nfa
+        dfa = nfa.to_dfa(unanchored=True)
+        self.assertTrue(dfa.evaluate('xxabbc'))
+        self.assertTrue(dfa.evaluate('acac'))
+        self.assertFalse(dfa.evaluate('abcb'))
+        self.assertTrue(dfa.minimize().evaluate('ababc'))
+
+    def test_grep_buffer(self):
+        dfa = regex.compile('ERROR: .*timeout').nfa.to_dfa(unanchored=True)
+        data = b'ok\nERROR: disk timeout\n\nx ERROR: timeout\xff\nERROR: '
+        lines = [data[x:y] for x, y in regex.grep_buffer(dfa, data)]
+        self.assertEqual(lines, [b'ERROR: disk timeout',
+                                 b'x ERROR: timeout\xff'])
+        self.assertEqual(list(regex.grep_buffer(dfa, data, 0, 10)), [])
+
+        #the empty string matches every line
+        dfa = regex.compile('a*').nfa.to_dfa(unanchored=True)
+        self.assertEqual(list(regex.grep_buffer(dfa, b'a\n\nb\n')),
+                         [(0, 1), (2, 2), (3, 4)])
+
+    def test_grep_buffer_literal(self):
+        dfa = regex.compile('ERROR: .*timeout').nfa.to_dfa(unanchored=True)
+        data = b'ok\nERROR: disk timeout\n\nx ERROR: timeout\nERROR: \nx'
+        expected = list(regex.grep_buffer(dfa, data))
+        self.assertEqual(len(expected), 2)
+        for literal in [b'ERROR: ', b'timeout', b'OR: ']:
+            self.assertEqual(list(regex.grep_buffer(dfa, data,
+                                                    literal=literal)),
+                             expected)
+        self.assertEqual(list(regex.grep_buffer(dfa, data, 0, 20,
+                                                literal=b'timeout')), [])
+
+    def test_grep_file(self):
+        dfa = regex.compile('b+').nfa.to_dfa(unanchored=True)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'a.txt')
+            with open(path, 'wb') as f:
+                f.write(b'abc\nxyz\nbb')
+            self.assertEqual(list(regex.grep_file(dfa, path)),
+                             [(0, b'abc'), (8, b'bb')])
+
+            path = os.path.join(directory, 'empty.txt')
+            open(path, 'wb').close()
+            self.assertEqual(list(regex.grep_file(dfa, path)), [])
+
+    def test_split_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'a.txt')
+            with open(path, 'wb') as f:
+                f.write(b'aaaa\nbb\nc\nddddddd')
+            self.assertEqual(regex.split_file(path, 100), [(0, 17)])
+            self.assertEqual(regex.split_file(path, 3),
+                             [(0, 5), (5, 8), (8, 17)])
+            self.assertEqual(regex.split_file(path, 2),
+                             [(0, 5), (5, 8), (8, 10), (10, 17)])
+            self.assertEqual(regex.split_file(path, 6), [(0, 8), (8, 17)])
+
+            with self.assertRaises(ValueError):
+                regex.split_file(path, 0)
+
+    def test_grep_parallel(self):
+        dfa = regex.compile('b+').nfa.to_dfa(unanchored=True).minimize()
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i in range(3):
+                paths.append(os.path.join(directory, str(i) + '.txt'))
+                with open(paths[-1], 'wb') as f:
+                    f.write(b'ab\nxx\n' * (10 * i) + b'b')
+            open(os.path.join(directory, 'empty.txt'), 'wb').close()
+            paths.append(os.path.join(directory, 'empty.txt'))
+
+            expected = []
+            for path in paths:
+                expected.extend([(path, x, y)
+                                 for x, y in regex.grep_file(dfa, path)])
+
+            result = list(regex.grep_parallel(dfa, paths, jobs=2,
+                                              chunk_size=16))
+            self.assertEqual(result, expected)
+            self.assertEqual(len(result), 1 + 11 + 21)
+
+class TestLiteralInfo(unittest.TestCase):
+    def test_literal_info(self):
+        cases = [
+            ('abc', 'abc', 'abc', 'abc'),
+            ('ERROR: .*timeout', 'ERROR: ', 'timeout', 'ERROR: '),
+            ('x.*abcd.y', 'x', 'y', 'abcd'),
+            ('abc|abd', 'ab', '', 'ab'),
+            ('xab|yab', '', 'ab', 'ab'),
+            ('(ab)+c', 'ab', 'abc', 'abc'),
+            ('a(b|c)d', 'a', 'd', 'a'),
+            ('(ab)*', '', '', ''),
+            ('a?b', '', 'b', 'b'),
+            ('(|)a', 'a', 'a', 'a'),
+            ('', '', '', ''),
+        ]
+        for pattern, prefix, suffix, required in cases:
+            info = regex.literal_info(regex.parse_regex(pattern))
+            self.assertEqual(info, (prefix, suffix, required), pattern)
+
+    def test_literal_info_long(self):
+        #the strings are cut, so long patterns take linear time and memory
+        n = regex.LITERAL_MAX_LENGTH
+        pattern = 'ab' * 20000 + 'c.*d' + 'ef' * 20000
+        info = regex.literal_info(regex.parse_regex(pattern))
+        self.assertEqual(info, (pattern[:n], pattern[-n:], pattern[:n]))
+        compiled = regex.Pattern(pattern, engine='nodes')
+        self.assertIsNotNone(compiled.search('x' + pattern + 'xd'))
+        self.assertIsNone(compiled.search(pattern[1:]))
+
+    def test_prefiltered_search(self):
+        text = 'xx ERROR: a timeout ERROR: b ERROR: timeout timeout'
+        for pattern in ['ERROR: .*timeout', 'ERROR: (a|b)', 'b|timeout',
+                        'a*', 'E.R']:
+            compiled = regex.compile(pattern)
+            nfa = compiled.nfa
+            expected = list(nfa.finditer(text))
+            self.assertEqual(list(compiled.finditer(text)), expected,
+                             pattern)
+            self.assertEqual(compiled.search(text, 20), nfa.search(text, 20))
+
+        nfa = regex.compile('ab*c').nfa
+        self.assertEqual(nfa.search('abbbd', prefix='a', required='c'), None)
+        self.assertEqual(nfa.search('abbcab', prefix='a', required='c'),
+                         (0, 4))
+        self.assertEqual(nfa.search('abbcabc', 1, prefix='a'), (4, 7))
+
+class TestAhoCorasick(unittest.TestCase):
+    def test_literal_alternatives(self):
+        cases = [
+            ('foo|bar|baz', ['foo', 'bar', 'baz']),
+            ('(a|bc)|(|d)', ['a', 'bc', '', 'd']),
+            ('\\*|\\.', ['*', '.']),
+            ('abc', None),
+            ('a|b*', None),
+            ('a|.', None),
+            ('x(a|b)|c', None),
+        ]
+        for pattern, words in cases:
+            self.assertEqual(regex.literal_alternatives(
+                regex.parse_regex(pattern)), words, pattern)
+
+    def test_search(self):
+        words = ['he', 'she', 'his', 'hers', 'abcd', 'bc']
+        aho_corasick = regex.AhoCorasick(words)
+        nfa = regex.compile('|'.join(words)).nfa
+        for s in ['ushers', 'abcd', 'xbcdabc', 'hishe', '', 'xyz']:
+            self.assertEqual(list(aho_corasick.finditer(s)),
+                             list(nfa.finditer(s)), s)
+
+        self.assertEqual(aho_corasick.search('ushers'), (1, 4))
+        self.assertEqual(aho_corasick.search('ushers', 2), (2, 6))
+
+        aho_corasick = regex.AhoCorasick(['', 'ab'])
+        self.assertEqual(list(aho_corasick.finditer('xab')),
+                         [(0, 0), (1, 3), (3, 3)])
+
+    def test_pattern(self):
+        pattern = regex.Pattern('foo|bar|ba')
+        self.assertIsNotNone(pattern.aho_corasick)
+        self.assertTrue(pattern.evaluate('ba'))
+        self.assertFalse(pattern.evaluate('baz'))
+        self.assertEqual(pattern.findall('foobazbarx'), ['foo', 'ba', 'bar'])
+        #the automata are not needed
+        self.assertIsNone(pattern._nfa)
+        self.assertIsNone(pattern._automaton)
+
+        self.assertIsNone(regex.Pattern('fo*').aho_corasick)
+
+class TestShiftOr(unittest.TestCase):
+    def test_shift_or_positions(self):
+        positions = regex.shift_or_positions(regex.parse_regex('a.(c|b|c)'))
+        self.assertEqual(positions, ['a', regex.ALPHABET, 'bc'])
+        positions = regex.shift_or_positions(regex.parse_regex('a(|)b'))
+        self.assertEqual(positions, ['a', 'b'])
+        self.assertEqual(regex.shift_or_positions(regex.parse_regex('a(b|)')),
+                         None)
+        self.assertEqual(regex.shift_or_positions(regex.parse_regex('a(b|cd)')),
+                         None)
+        self.assertEqual(regex.shift_or_positions(regex.parse_regex('ab*')),
+                         None)
+        self.assertEqual(regex.shift_or_positions(regex.parse_regex('')),
+                         None)
+        self.assertEqual(regex.shift_or_positions(regex.parse_regex('a' * 65)),
+                         None)
+
+    def test_search(self):
+        shift_or = regex.ShiftOr(['a', 'bc', regex.ALPHABET, 'd'])
+        self.assertTrue(shift_or.evaluate('ab d'))
+        self.assertFalse(shift_or.evaluate('aad'))
+        self.assertFalse(shift_or.evaluate('abxdd'))
+        self.assertEqual(shift_or.search('xaacdabcd'), (5, 9))
+        self.assertEqual(list(shift_or.finditer('abxdacxdaaxd')),
+                         [(0, 4), (4, 8)])
+        self.assertEqual(shift_or.search('abc'), None)
+
+        with self.assertRaises(ValueError):
+            regex.ShiftOr([])
+
+    def test_mismatches(self):
+        shift_or = regex.ShiftOr(['a', 'b', 'c', 'd'])
+        self.assertEqual(shift_or.search('xabxdabcd', max_mismatches=0),
+                         (5, 9))
+        self.assertEqual(shift_or.search('xabxdabcd', max_mismatches=1),
+                         (1, 5))
+        self.assertEqual(shift_or.search('xxxxbcdx', max_mismatches=1),
+                         (3, 7))
+        self.assertEqual(shift_or.search('xxxxxxx', max_mismatches=3), None)
+        self.assertEqual(shift_or.search('xxxxxxx', max_mismatches=4), (0, 4))
+        self.assertEqual(list(shift_or.finditer('abxdaxcd', 0, 1)),
+                         [(0, 4), (4, 8)])
+
+    def test_pattern(self):
+        pattern = regex.Pattern('a.(b|c)*')
+        self.assertIsNone(pattern.shift_or)
+        pattern = regex.Pattern('ERR.(R|r)')
+        self.assertIsNotNone(pattern.shift_or)
+        self.assertTrue(pattern.evaluate('ERROR'))
+        self.assertEqual(pattern.findall('xERRORERR rERR'), ['ERROR', 'ERR r'])
+        self.assertIsNone(pattern._nfa)
+
+    def test_engines(self):
+        #the fast paths are only used by the default engine, so the other
+        #engines can be benchmarked on any pattern
+        for pattern in ['a.b', 'foo|bar']:
+            self.assertTrue(regex.Pattern(pattern).shift_or is not None
+                            or regex.Pattern(pattern).aho_corasick is not None)
+            for engine in ['lazy_dfa', 'nodes', 'bitset']:
+                compiled = regex.Pattern(pattern, engine)
+                self.assertIsNone(compiled.shift_or)
+                self.assertIsNone(compiled.aho_corasick)
+                self.assertTrue(compiled.evaluate(pattern.split('|')[0]
+                                                  .replace('.', 'x')))
+                self.assertIsNotNone(compiled._nfa)
+                self.assertEqual(compiled.findall('xfooa-bbar'),
+                                 regex.Pattern(pattern).findall('xfooa-bbar'))
+
+class TestPikeVM(unittest.TestCase):
+    def expected_spans(self, match, n_groups):
+        if match is None:
+            return None
+        return [None if match.span(g) == (-1, -1) else match.span(g)
+                for g in range(n_groups + 1)]
+
+    def test_against_re(self):
+        #empty iterations of * and + differ from re, see test_empty_loop
+        patterns = ['(a*)(b|c)+(x)?', '(a|ab)(c|bcd)(d*)', '((a)|b)*',
+                    '(a+)(a*)', 'x(.)(y|)z', '()', '((a)(b))c', 'a*(b?)b']
+        strings = ['', 'a', 'ab', 'abcd', 'aabcbx', 'aaab', 'bab', 'xyz',
+                   'xaz', 'zzxzab', 'abc']
+        for pattern in patterns:
+            vm = regex.PikeVM(regex.parse_regex(pattern))
+            n_groups = re.compile(pattern).groups
+            self.assertEqual(vm.n_groups, n_groups)
+            for s in strings:
+                self.assertEqual(
+                    vm.fullmatch(s),
+                    self.expected_spans(re.fullmatch(pattern, s), n_groups),
+                    (pattern, s))
+                self.assertEqual(
+                    vm.search(s),
+                    self.expected_spans(re.search(pattern, s), n_groups),
+                    (pattern, s))
+
+    def test_empty_loop(self):
+        #an iteration matching only the empty string is not taken
+        vm = regex.PikeVM(regex.parse_regex('(a*)*b'))
+        self.assertEqual(vm.fullmatch('ab'), [(0, 2), (0, 1)])
+        self.assertEqual(vm.fullmatch('b'), [(0, 1), None])
+
+    def test_adversarial(self):
+        #exponential for backtracking matchers
+        vm = regex.PikeVM(regex.parse_regex('(a*)*(a|b)*c'))
+        self.assertIsNone(vm.fullmatch('a' * 200))
+        self.assertEqual(vm.search('a' * 200 + 'c')[0], (0, 201))
+
+    def test_pattern(self):
+        pattern = regex.Pattern('(k+)=(v*)')
+        self.assertEqual(pattern.fullmatch_groups('kk=vvv'),
+                         [(0, 6), (0, 2), (3, 6)])
+        self.assertIsNone(pattern.fullmatch_groups('kk=vx'))
+        self.assertEqual(pattern.search_groups('x k=v', 1),
+                         [(2, 5), (2, 3), (4, 5)])
+
+class TestOnePassDFA(unittest.TestCase):
+    def test_one_pass_dfa(self):
+        cases = [
+            ('(k+)=(v*)', True),
+            ('(a|b)*c', True),
+            ('x(.)(y|)z', True),
+            ('((a)(b))c', True),
+            ('(a*)(b|c)+(x)?', True),
+            ('(a|ab)(c|bcd)(d*)', False),
+            ('(a+)(a*)', False),
+            ('a*(b?)b', False),
+            ('(a*)*', False),
+        ]
+        strings = ['', 'k=', 'kk=vv', 'abc', 'xyz', 'xaz', 'abcd', 'aabcbx',
+                   'aaa', 'abbab', 'k=vk', 'abbabbc']
+        for pattern, one_pass in cases:
+            vm = regex.PikeVM(regex.parse_regex(pattern))
+            dfa = regex.one_pass_dfa(vm.program, vm.n_groups)
+            self.assertEqual(dfa is not None, one_pass, pattern)
+            if dfa is None:
+                continue
+            for s in strings:
+                self.assertEqual(dfa.fullmatch(s), vm.fullmatch(s),
+                                 (pattern, s))
+
+    def test_pattern(self):
+        pattern = regex.Pattern('(k+)=(v*)')
+        self.assertIsNotNone(pattern.one_pass_dfa)
+        self.assertEqual(pattern.fullmatch_groups('kk=v'),
+                         [(0, 4), (0, 2), (3, 4)])
+
+        pattern = regex.Pattern('(a+)(a*)')
+        self.assertIsNone(pattern.one_pass_dfa)
+        self.assertEqual(pattern.fullmatch_groups('aaa'),
+                         [(0, 3), (0, 3), (3, 3)])
+
+class TestReverseDFA(unittest.TestCase):
+    def test_reverse(self):
+        nfa = regex.compile('ab*c').nfa.reverse()
+        self.assertTrue(nfa.evaluate('cbba'))
+        self.assertFalse(nfa.evaluate('abbc'))
+
+    def test_longest_match(self):
+        dfa = regex.compile('ab*').automaton
+        self.assertEqual(dfa.longest_match('xabbx', 1), 4)
+        self.assertEqual(dfa.longest_match('xabbx', 0), -1)
+        self.assertEqual(regex.compile('a*').automaton.longest_match('b'), 0)
+
+    def test_reverse_scan(self):
+        reverse_dfa = regex.compile('ab*c').reverse_dfa
+        self.assertEqual(reverse_dfa.reverse_scan('abcxabbcac'), [0, 4, 8])
+        self.assertEqual(reverse_dfa.reverse_scan('abcxabbcac', 5), [8])
+
+    def test_dfa_finditer(self):
+        patterns = ['ab*', 'a|ab|abc', 'abcd|bcdef', 'a*', 'b(a|b)*c',
+                    '(ab)*(c|)']
+        strings = ['', 'abxabbaab', 'xabcx', 'abcdef', 'baa', 'xbabcbcc',
+                   'ababcab']
+        for pattern in patterns:
+            compiled = regex.Pattern(pattern, 'dfa')
+            for s in strings:
+                for pos in [0, 2]:
+                    self.assertEqual(list(compiled.finditer(s, pos)),
+                                     list(compiled.nfa.finditer(s, pos)),
+                                     (pattern, s, pos))
+
+class TestDiskCache(unittest.TestCase):
+    def test_get(self):
+        built = []
+        def build():
+            built.append(1)
+            return regex.Pattern('ab*').nfa.to_dfa().minimize()
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = regex.DiskCache(directory)
+            dfa = cache.get('ab*', 'dfa', build)
+            self.assertEqual(cache.get('ab*', 'dfa', build), dfa)
+            self.assertEqual(len(built), 1)
+            info = cache.cache_info()
+            self.assertEqual((info.hits, info.misses), (1, 1))
+            self.assertEqual(info.currsize, len(dfa.to_bytes()))
+
+            #other flags and other processes
+            cache.get('ab*', 'search', build)
+            self.assertEqual(len(built), 2)
+            other = regex.DiskCache(directory)
+            self.assertEqual(other.get('ab*', 'dfa', build), dfa)
+            self.assertEqual(len(built), 2)
+
+            #corrupted entries are rebuilt
+            with open(cache.path('ab*', 'dfa'), 'wb') as f:
+                f.write(b'garbage')
+            self.assertEqual(cache.get('ab*', 'dfa', build), dfa)
+            self.assertEqual(len(built), 3)
+
+            cache.cache_clear()
+            self.assertEqual(cache.cache_info(), (0, 0, 0, 64 << 20, 0))
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            size = len(regex.compile('a').automaton.to_bytes())
+            cache = regex.DiskCache(directory, 2 * size)
+            for i, pattern in enumerate(['a', 'b', 'c']):
+                cache.get(pattern, 'dfa',
+                          lambda: regex.Pattern(pattern).automaton)
+                os.utime(cache.path(pattern, 'dfa'), ns=(i, i))
+                if pattern == 'b':
+                    #'a' becomes the most recently used
+                    cache.get('a', 'dfa', None)
+
+            self.assertEqual(cache.evictions, 1)
+            self.assertTrue(os.path.exists(cache.path('a', 'dfa')))
+            self.assertFalse(os.path.exists(cache.path('b', 'dfa')))
+            self.assertTrue(os.path.exists(cache.path('c', 'dfa')))
+
+        with self.assertRaises(ValueError):
+            regex.DiskCache(directory, -1)
+
+    def test_pattern(self):
+        with tempfile.TemporaryDirectory() as directory:
+            regex.set_disk_cache(directory)
+            try:
+                pattern = regex.Pattern('a(b|c)*d')
+                self.assertTrue(pattern.evaluate('abcd'))
+                self.assertEqual(list(pattern.finditer('xadabd')),
+                                 [(1, 3), (3, 6)])
+                self.assertEqual(len(os.listdir(directory)), 2)
+
+                pattern = regex.Pattern('a(b|c)*d')
+                self.assertTrue(pattern.evaluate('abcd'))
+                self.assertIsInstance(pattern.automaton.table, memoryview)
+                self.assertEqual(regex.disk_cache.cache_info().hits, 1)
+            finally:
+                regex.set_disk_cache(None)
+
+class TestCompile(unittest.TestCase):
+    def setUp(self):
+        regex.purge()
+
+    def tearDown(self):
+        regex.purge()
+
+    def test_compile(self):
+        a = regex.compile('ab*')
+        self.assertTrue(a.evaluate('abb'))
+        self.assertIs(regex.compile('ab*'), a)
+        self.assertIsNot(regex.compile('ab*', engine='bitset'), a)
+        self.assertEqual(regex.cache_info(),
+                         regex.CacheInfo(1, 2, 0, 512, 2))
+
+        regex.purge()
+        self.assertIsNot(regex.compile('ab*'), a)
+
+    def test_eviction(self):
+        cache = regex.PatternCache(maxsize=2)
+        a = cache.get('a')
+        b = cache.get('b')
+        self.assertIs(cache.get('a'), a)
+        cache.get('c')
+        #b was the least recently used
+        self.assertEqual(list(cache.cache), [('a', 'dfa'), ('c', 'dfa')])
+        self.assertEqual(cache.cache_info().evictions, 1)
+        self.assertIsNot(cache.get('b'), b)
+
+        cache = regex.PatternCache(maxsize=0)
+        cache.get('a')
+        self.assertEqual(cache.cache_info().currsize, 0)
+
+    def test_threads(self):
+        results = []
+        def worker():
+            for i in range(50):
+                results.append(regex.compile('x' + str(i % 5)))
+
+        threads = [threading.Thread(target=worker) for i in range(4)]
+        for x in threads:
+            x.start()
+        for x in threads:
+            x.join()
+
+        self.assertEqual(len({id(x) for x in results}), 5)
+        info = regex.cache_info()
+        self.assertEqual(info.hits + info.misses, 200)
+        self.assertEqual(info.currsize, 5)
+
 if __name__ == '__main__':
     unittest.main()